@@ -6,6 +6,7 @@ Uses YOLOv8 to detect objects in video frames
 
 import sys
 import json
+import random
 import cv2
 import numpy as np
 from pathlib import Path
@@ -16,25 +17,43 @@ except ImportError:
     print("YOLOv8 not installed. Using dummy detection.")
     YOLO = None
 
+# Candidate objects for dummy detection
+POSSIBLE_OBJECTS = (
+    'person', 'chair', 'table', 'laptop', 'cell phone', 'book', 'cup', 'bottle',
+    'sneakers', 'hat', 'shirt', 'pants', 'handbag', 'watch', 'glasses', 'couch',
+    'tv', 'lamp', 'plant', 'car', 'bicycle', 'dog', 'cat', 'keyboard', 'mouse'
+)
+
 def extract_frames(video_path, max_frames=10):
     """Extract frames from video for object detection"""
     cap = cv2.VideoCapture(video_path)
     frames = []
-    frame_count = 0
     
     # Get total frame count
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    frame_interval = max(1, total_frames // max_frames)
+    if total_frames > 0:
+        sample_indices = np.linspace(0, total_frames - 1, min(max_frames, total_frames)).astype(int)
+    else:
+        sample_indices = np.arange(max_frames)
     
-    while cap.isOpened() and len(frames) < max_frames:
+    # Only decode the sampled frames: seek when supported, otherwise grab() past the rest
+    position = 0
+    seekable = True
+    for frame_index in sample_indices:
+        frame_index = int(frame_index)
+        if seekable and cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index):
+            position = frame_index
+        else:
+            seekable = False
+            while position < frame_index and cap.grab():
+                position += 1
+        
         ret, frame = cap.read()
         if not ret:
             break
-            
-        if frame_count % frame_interval == 0:
-            frames.append(frame)
-            
-        frame_count += 1
+        
+        frames.append(frame)
+        position += 1
     
     cap.release()
     return frames
@@ -56,23 +75,16 @@ def detect_objects_yolo(frames):
         detected_objects = set()
         
         for frame in frames:
-            # Run detection with verbose=False to suppress debug output
-            results = model(frame, verbose=False)
+            # Run detection with verbose=False to suppress debug output;
+            # conf/iou make NMS drop low-confidence boxes before they leave the device
+            results = model(frame, conf=0.5, iou=0.45, verbose=False)
             
             for result in results:
                 boxes = result.boxes
                 if boxes is not None:
-                    for box in boxes:
-                        # Get class name
-                        class_id = int(box.cls[0])
-                        class_name = model.names[class_id]
-                        
-                        # Get confidence
-                        confidence = float(box.conf[0])
-                        
-                        # Only include high-confidence detections
-                        if confidence > 0.5:
-                            detected_objects.add(class_name)
+                    # Copy class ids off the device once per frame
+                    class_ids = boxes.cls.cpu().numpy().astype(np.int32)
+                    detected_objects.update(model.names[int(c)] for c in np.unique(class_ids))
         
         return list(detected_objects)
         
@@ -83,17 +95,9 @@ def detect_objects_yolo(frames):
 
 def get_dummy_objects():
     """Return dummy objects for demo purposes"""
-    import random
-    
-    possible_objects = [
-        'person', 'chair', 'table', 'laptop', 'cell phone', 'book', 'cup', 'bottle',
-        'sneakers', 'hat', 'shirt', 'pants', 'handbag', 'watch', 'glasses', 'couch',
-        'tv', 'lamp', 'plant', 'car', 'bicycle', 'dog', 'cat', 'keyboard', 'mouse'
-    ]
-    
     # Return 3-6 random objects
     num_objects = random.randint(3, 6)
-    return random.sample(possible_objects, num_objects)
+    return random.sample(POSSIBLE_OBJECTS, num_objects)
 
 def main():
     """Main function"""
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Detection Server for Lokal Backend
+Keeps the YOLO model loaded and serves enhanced object detection over a Unix socket
+"""
+
+import os
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+import numpy as np
+
+import enhanced_detect_objects
+from enhanced_detect_objects import EnhancedObjectDetector, DETECT_SOCKET_PATH, dumps_json, logger
+
+# One inference at a time: requests share a single model on a single GPU
+executor = ThreadPoolExecutor(max_workers=1)
+detector: Optional[EnhancedObjectDetector] = None
+
+def get_detector() -> EnhancedObjectDetector:
+    """The server's single detector, with its staging buffers, created on first use"""
+    global detector
+    if detector is None:
+        detector = EnhancedObjectDetector(confidence_threshold=0.6, iou_threshold=0.45)
+    return detector
+
+def detect(video_path: str, confidence_threshold: float) -> Dict:
+    """
+    Run one request on the shared detector
+    
+    Only ever called on the single-thread executor, so setting the
+    threshold for this request can't affect another one in flight.
+    """
+    shared = get_detector()
+    shared.confidence_threshold = confidence_threshold
+    return shared.detect_objects(video_path)
+
+def warm_up():
+    """Load the model and run one dummy inference so the first request skips autotuning"""
+    get_detector()
+    if enhanced_detect_objects.YOLO_MODEL is not None:
+        enhanced_detect_objects.YOLO_MODEL(np.zeros((640, 640, 3), dtype=np.uint8), verbose=False)
+        logger.info("🔥 YOLO model warmed up")
+
+async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Serve one newline-delimited JSON request: {"video_path": ..., "conf": ...}"""
+    loop = asyncio.get_running_loop()
+    
+    try:
+        request = json.loads(await reader.readline())
+        result = await loop.run_in_executor(
+            executor, detect, request["video_path"], float(request.get("conf", 0.6))
+        )
+    except Exception as e:
+        logger.error(f"❌ Request failed: {e}")
+        result = {
+            "error": f"Detection failed: {str(e)}",
+            "objects": [],
+            "detection_method": "Error"
+        }
+    
+    try:
+        writer.write((dumps_json(result) + "\n").encode())
+        await writer.drain()
+    except (ConnectionResetError, BrokenPipeError):
+        # The client timed out and fell back to detecting in its own process
+        logger.warning("⚠️ Client disconnected before the result was sent")
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+
+async def serve():
+    """Start the Unix socket server"""
+    if os.path.exists(DETECT_SOCKET_PATH):
+        os.unlink(DETECT_SOCKET_PATH)
+    
+    await asyncio.get_running_loop().run_in_executor(executor, warm_up)
+    
+    server = await asyncio.start_unix_server(handle_client, path=DETECT_SOCKET_PATH)
+    # Only this user may send paths to read; /tmp would otherwise leave it open to all
+    os.chmod(DETECT_SOCKET_PATH, 0o600)
+    logger.info(f"🚀 Detection server listening on {DETECT_SOCKET_PATH}")
+    
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if os.path.exists(DETECT_SOCKET_PATH):
+            os.unlink(DETECT_SOCKET_PATH)
+
+def main():
+    """Main function for command line usage"""
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        logger.info("👋 Detection server stopped")
+
+if __name__ == "__main__":
+    main()
@@ -39,6 +39,8 @@ CREATE INDEX IF NOT EXISTS idx_video_uploads_user_id ON video_uploads(user_id);
 CREATE INDEX IF NOT EXISTS idx_video_uploads_status ON video_uploads(status);
 CREATE INDEX IF NOT EXISTS idx_detected_objects_video_id ON detected_objects(video_id);
 CREATE INDEX IF NOT EXISTS idx_matched_products_object_id ON matched_products(object_id);
+CREATE INDEX IF NOT EXISTS idx_detected_objects_video_confidence ON detected_objects(video_id, confidence DESC);
+CREATE INDEX IF NOT EXISTS idx_video_uploads_in_progress ON video_uploads(status) WHERE status <> 'completed';
 
 -- Enable Row Level Security (RLS)
 ALTER TABLE video_uploads ENABLE ROW LEVEL SECURITY;
@@ -6,15 +6,20 @@ Demonstrates how to use the video processing pipeline
 
 import os
 import sys
+import logging
+import queue
+import threading
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 def example_basic_usage():
     """Example of basic pipeline usage"""
-    print("🎬 Example: Basic Pipeline Usage")
-    print("="*50)
+    logger.info("🎬 Example: Basic Pipeline Usage")
+    logger.info("="*50)
     
     try:
         from pipeline_runner import LokalPipeline
@@ -31,30 +36,30 @@ def example_basic_usage():
         user_id = "example-user-123"
         
         if os.path.exists(video_path):
-            print(f"Processing video: {video_path}")
+            logger.info(f"Processing video: {video_path}")
             results = pipeline.process_video(video_path, user_id)
             
             if results["success"]:
-                print(f"✅ Processing completed!")
-                print(f"📊 Results:")
-                print(f"   - Processing time: {results['processing_time']:.2f}s")
-                print(f"   - Frames processed: {results['processed_frames']}")
-                print(f"   - Detections: {results['total_detections']}")
-                print(f"   - Matches: {results['total_matches']}")
-                print(f"   - FPS: {results['fps']:.2f}")
+                logger.info(f"✅ Processing completed!")
+                logger.info(f"📊 Results:")
+                logger.info(f"   - Processing time: {results['processing_time']:.2f}s")
+                logger.info(f"   - Frames processed: {results['processed_frames']}")
+                logger.info(f"   - Detections: {results['total_detections']}")
+                logger.info(f"   - Matches: {results['total_matches']}")
+                logger.info(f"   - FPS: {results['fps']:.2f}")
             else:
-                print(f"❌ Processing failed: {results.get('error', 'Unknown error')}")
+                logger.error(f"❌ Processing failed: {results.get('error', 'Unknown error')}")
         else:
-            print(f"⚠️  Video file not found: {video_path}")
-            print("   Create a test video first or update the path")
+            logger.warning(f"⚠️  Video file not found: {video_path}")
+            logger.warning("   Create a test video first or update the path")
     
     except Exception as e:
-        print(f"❌ Error in basic usage example: {e}")
+        logger.error(f"❌ Error in basic usage example: {e}")
 
 def example_component_usage():
     """Example of using individual components"""
-    print("\n🔧 Example: Individual Component Usage")
-    print("="*50)
+    logger.info("\n🔧 Example: Individual Component Usage")
+    logger.info("="*50)
     
     try:
         from video_processor import VideoProcessor
@@ -72,57 +77,124 @@ def example_component_usage():
         video_path = "test_video.mp4"
         
         if os.path.exists(video_path):
-            print(f"Processing video: {video_path}")
+            logger.info(f"Processing video: {video_path}")
             
             # Get video info
             video_info = processor.get_video_info(video_path)
-            print(f"📊 Video info: {video_info['frame_count']} frames, {video_info['duration']:.2f}s")
+            logger.info(f"📊 Video info: {video_info['frame_count']} frames, {video_info['duration']:.2f}s")
             
-            # Process first few frames
-            frame_count = 0
-            for frame_num, frame in processor.extract_frames(video_path):
-                if frame_count >= 3:  # Only process first 3 frames for demo
-                    break
+            # Decode on a producer thread so frame extraction overlaps
+            # detection; the bounded queue keeps at most two batches in flight
+            max_frames = 3  # Only process first 3 frames for demo
+            batch_size = 3
+            frame_queue = queue.Queue(maxsize=2 * batch_size)
+            
+            def decode_frames():
+                try:
+                    for i, item in enumerate(processor.extract_frames(video_path)):
+                        if i >= max_frames:
+                            break
+                        frame_queue.put(item)
+                finally:
+                    frame_queue.put(None)
+            
+            threading.Thread(target=decode_frames, daemon=True).start()
+            
+            done = False
+            while not done:
+                # Block for the first frame, then drain whatever is ready
+                frames = []
+                item = frame_queue.get()
+                while item is not None:
+                    frames.append(item)
+                    if len(frames) >= batch_size:
+                        break
+                    try:
+                        item = frame_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                done = item is None
                 
-                print(f"\n🖼️  Processing frame {frame_num + 1}...")
+                if not frames:
+                    continue
                 
-                # Detect objects
-                detections = detector.detect_objects(frame)
-                print(f"   Detected {len(detections)} objects")
+                batch_detections = detector.detect_objects_batch([frame for _, frame in frames])
                 
-                if detections:
-                    # Crop detected objects
-                    cropped_detections = cropper.crop_detections(frame, detections)
-                    print(f"   Cropped {len(cropped_detections)} objects")
+                for (frame_num, frame), detections in zip(frames, batch_detections):
+                    logger.info(f"🖼️  Frame {frame_num + 1}: detected {len(detections)} objects")
                     
-                    # Match products (if OpenAI API is available)
-                    for i, detection in enumerate(cropped_detections):
-                        print(f"   Object {i+1}: {detection['class_name']} (confidence: {detection['confidence']:.2f})")
-                        
-                        # Convert to PIL for matching
-                        pil_crop = cropper.crop_to_pil(detection["crop"])
+                    if detections:
+                        # Crop detected objects
+                        cropped_detections = cropper.crop_detections(frame, detections)
+                        logger.info(f"   Cropped {len(cropped_detections)} objects")
                         
-                        # Try to match product
-                        try:
-                            match_result = matcher.match_product(pil_crop)
-                            if match_result.get("success", False):
-                                print(f"     → Matched: {match_result['product_name']}")
-                            else:
-                                print(f"     → No match found")
-                        except Exception as e:
-                            print(f"     → Matching failed: {e}")
+                        # Match products (if OpenAI API is available)
+                        for i, detection in enumerate(cropped_detections):
+                            if logger.isEnabledFor(logging.DEBUG):
+                                logger.debug(f"   Object {i+1}: {detection['class_name']} (confidence: {detection['confidence']:.2f})")
+                            
+                            # Convert to PIL for matching
+                            pil_crop = cropper.crop_to_pil(detection["crop"])
+                            
+                            # Try to match product
+                            try:
+                                match_result = matcher.match_product(pil_crop)
+                                if match_result.get("success", False):
+                                    logger.info(f"     → Matched: {match_result['product_name']}")
+                                else:
+                                    logger.debug("     → No match found")
+                            except Exception as e:
+                                logger.warning(f"     → Matching failed: {e}")
+        else:
+            logger.warning(f"⚠️  Video file not found: {video_path}")
+    
+    except Exception as e:
+        logger.error(f"❌ Error in component usage example: {e}")
+
+def example_gpu_resident_usage():
+    """Example of decoding, detecting and cropping entirely on the GPU"""
+    logger.info("\n⚡ Example: GPU-Resident Component Usage")
+    logger.info("="*50)
+    
+    try:
+        import torch
+        from video_processor import VideoProcessor, TORCHCODEC_AVAILABLE
+        from object_detector import ObjectDetector
+        from cropper import Cropper, TORCHVISION_AVAILABLE
+        
+        if not (torch.cuda.is_available() and TORCHCODEC_AVAILABLE and TORCHVISION_AVAILABLE):
+            logger.warning("⚠️  Needs a CUDA GPU with torchcodec and torchvision installed")
+            return
+        
+        processor = VideoProcessor(frame_rate=15)
+        detector = ObjectDetector(confidence_threshold=0.6)
+        cropper = Cropper(min_size=100)
+        
+        # Example video path
+        video_path = "test_video.mp4"
+        
+        if os.path.exists(video_path):
+            logger.info(f"Processing video: {video_path}")
+            
+            # Frames go NVDEC -> YOLO -> roi_align without touching host memory;
+            # only the final crops are copied back
+            for frame_num, frame_tensor in processor.extract_frames_cuda(video_path):
+                if frame_num >= 3:  # Only process first 3 frames for demo
+                    break
                 
-                frame_count += 1
+                boxes, confidences, class_ids = detector.detect_objects_gpu(frame_tensor)
+                crops = cropper.crop_detections_gpu(frame_tensor, boxes)
+                logger.info(f"🖼️  Frame {frame_num + 1}: {len(boxes)} objects, {len(crops)} crops")
         else:
-            print(f"⚠️  Video file not found: {video_path}")
+            logger.warning(f"⚠️  Video file not found: {video_path}")
     
     except Exception as e:
-        print(f"❌ Error in component usage example: {e}")
+        logger.error(f"❌ Error in GPU-resident usage example: {e}")
 
 def example_custom_configuration():
     """Example of custom configuration"""
-    print("\n⚙️  Example: Custom Configuration")
-    print("="*50)
+    logger.info("\n⚙️  Example: Custom Configuration")
+    logger.info("="*50)
     
     try:
         from pipeline_runner import LokalPipeline
@@ -135,7 +207,7 @@ def example_custom_configuration():
             confidence_threshold=0.7,  # Higher confidence = fewer detections
             model_path="yolov8n.pt"  # Fastest model
         )
-        print("🚀 Fast pipeline configured for speed")
+        logger.info("🚀 Fast pipeline configured for speed")
         
         # High-quality processing (higher quality, slower)
         quality_pipeline = LokalPipeline(
@@ -143,7 +215,7 @@ def example_custom_configuration():
             confidence_threshold=0.3,  # Lower confidence = more detections
             model_path="yolov8s.pt"  # Better model (if available)
         )
-        print("🎯 Quality pipeline configured for accuracy")
+        logger.info("🎯 Quality pipeline configured for accuracy")
         
         # Balanced processing
         balanced_pipeline = LokalPipeline(
@@ -151,15 +223,15 @@ def example_custom_configuration():
             confidence_threshold=0.5,
             model_path="yolov8n.pt"
         )
-        print("⚖️  Balanced pipeline configured for efficiency")
+        logger.info("⚖️  Balanced pipeline configured for efficiency")
         
     except Exception as e:
-        print(f"❌ Error in custom configuration example: {e}")
+        logger.error(f"❌ Error in custom configuration example: {e}")
 
 def example_error_handling():
     """Example of error handling"""
-    print("\n🛡️  Example: Error Handling")
-    print("="*50)
+    logger.info("\n🛡️  Example: Error Handling")
+    logger.info("="*50)
     
     try:
         from pipeline_runner import LokalPipeline
@@ -171,33 +243,36 @@ def example_error_handling():
         results = pipeline.process_video("non_existent_video.mp4", "user-123")
         
         if not results["success"]:
-            print(f"✅ Error handled gracefully: {results.get('error', 'Unknown error')}")
+            logger.info(f"✅ Error handled gracefully: {results.get('error', 'Unknown error')}")
         
         # Clean up temporary files
         pipeline.cleanup_temp_files()
-        print("✅ Temporary files cleaned up")
+        logger.info("✅ Temporary files cleaned up")
         
     except Exception as e:
-        print(f"❌ Error in error handling example: {e}")
+        logger.error(f"❌ Error in error handling example: {e}")
 
 def main():
     """Run all examples"""
-    print("🎬 Lokal Engine Examples")
-    print("="*60)
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper(), format='%(message)s')
+    
+    logger.info("🎬 Lokal Engine Examples")
+    logger.info("="*60)
     
     # Check if environment is set up
     if not os.path.exists(".env"):
-        print("⚠️  No .env file found. Please run setup.py first.")
-        print("   Or create .env with your credentials:")
-        print("   SUPABASE_URL=your-url")
-        print("   SUPABASE_KEY=your-key")
-        print("   OPENAI_API_KEY=your-key")
-        print()
+        logger.warning("⚠️  No .env file found. Please run setup.py first.")
+        logger.warning("   Or create .env with your credentials:")
+        logger.warning("   SUPABASE_URL=your-url")
+        logger.warning("   SUPABASE_KEY=your-key")
+        logger.warning("   OPENAI_API_KEY=your-key")
+        logger.info("")
     
     # Run examples
     examples = [
         example_basic_usage,
         example_component_usage,
+        example_gpu_resident_usage,
         example_custom_configuration,
         example_error_handling,
     ]
@@ -206,16 +281,16 @@ def main():
         try:
             example_func()
         except Exception as e:
-            print(f"❌ Example failed: {e}")
+            logger.error(f"❌ Example failed: {e}")
         
-        print("\n" + "-"*60 + "\n")
+        logger.info("\n" + "-"*60 + "\n")
     
-    print("🎉 Examples completed!")
-    print("\nNext steps:")
-    print("1. Set up your .env file with credentials")
-    print("2. Create or obtain a test video")
-    print("3. Run the examples again")
-    print("4. Integrate the engine into your application")
+    logger.info("🎉 Examples completed!")
+    logger.info("\nNext steps:")
+    logger.info("1. Set up your .env file with credentials")
+    logger.info("2. Create or obtain a test video")
+    logger.info("3. Run the examples again")
+    logger.info("4. Integrate the engine into your application")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -4,40 +4,141 @@ Sends crops to OpenAI and returns product matches
 """
 
 import os
+import asyncio
 import base64
 import io
+import json
+import logging
+import re
+import threading
+from collections import OrderedDict
 from typing import List, Dict, Optional
-from openai import OpenAI
+import httpx
+from openai import OpenAI, AsyncOpenAI
 from PIL import Image
+import cv2
 import numpy as np
 from dotenv import load_dotenv
 
+# HTTP/2 in httpx needs the h2 package
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+# libjpeg-turbo SIMD encoder for crops
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+    _turbo_jpeg = TurboJPEG()
+    TURBOJPEG_AVAILABLE = True
+except (ImportError, OSError):
+    # OSError: the Python wrapper is installed but libturbojpeg isn't
+    TURBOJPEG_AVAILABLE = False
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Brand keywords recognised by the fallback parser, in priority order
+_BRAND_PRODUCTS = {
+    "nike": "Nike Product",
+    "adidas": "Adidas Product",
+    "iphone": "iPhone",
+    "samsung": "Samsung Product"
+}
+
+# Upper bound on concurrent OpenAI requests in batch_match_products
+MAX_CONCURRENT_MATCHES = 16
+
+# Keep-alive pool for OpenAI requests, sized above the batch concurrency
+HTTP_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=32)
+HTTP_TIMEOUT = 60.0
+
+# Match results kept for repeated crops, keyed by (dHash, context, cache_tag)
+MATCH_CACHE_SIZE = 1024
+
+# Outermost {...} span in a model response
+_JSON_RE = re.compile(r'\{.*\}', re.DOTALL)
+
+# Fields guaranteed on every parsed match result
+_DEFAULTS = {
+    "success": True,
+    "product_name": "Unknown",
+    "category": "unknown",
+    "confidence": 0.0,
+    "description": "",
+    "brand": "",
+    "color": "",
+    "suggested_queries": []
+}
+
+def _dhash(gray: np.ndarray) -> int:
+    """64-bit difference hash of a grayscale crop, used to spot repeated crops"""
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    return int.from_bytes(np.packbits(small[:, 1:] > small[:, :-1]).tobytes(), 'big')
+
 class ProductMatcher:
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, cache_size: int = MATCH_CACHE_SIZE):
         """
         Initialize product matcher
         
         Args:
             api_key: OpenAI API key (will use env var if not provided)
+            cache_size: Matches kept in the repeated crop cache
         """
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.cache_size = cache_size
         
         if not self.api_key:
             raise ValueError("OpenAI API key is required")
         
-        self.client = OpenAI(api_key=self.api_key)
+        self.client = OpenAI(
+            api_key=self.api_key,
+            http_client=httpx.Client(http2=HTTP2_AVAILABLE, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+        )
+        
+        # Per-thread encode buffer reused by image_to_base64
+        self._tls = threading.local()
+        
+        # LRU of successful matches keyed by crop hash
+        self._cache = OrderedDict()
         
         # Product categories for better matching
         self.product_categories = [
             "clothing", "shoes", "accessories", "electronics", "home", "beauty",
             "sports", "jewelry", "bags", "watches", "furniture", "kitchen"
         ]
+        
+        # Single-pass matcher for brand and category keywords
+        self._keyword_automaton = self._build_keyword_automaton() if AHOCORASICK_AVAILABLE else None
+    
+    def _build_keyword_automaton(self):
+        """
+        Build an Aho-Corasick automaton over brand and category keywords
+        
+        Returns:
+            Automaton whose values are (kind, priority, label) tuples
+        """
+        automaton = ahocorasick.Automaton()
+        
+        for priority, (keyword, product_name) in enumerate(_BRAND_PRODUCTS.items()):
+            automaton.add_word(keyword, ("brand", priority, product_name))
+        for priority, category in enumerate(self.product_categories):
+            automaton.add_word(category, ("category", priority, category))
+        
+        automaton.make_automaton()
+        return automaton
     
     def image_to_base64(self, image: Image.Image) -> str:
         """
-        Convert PIL Image to base64 string
+        Convert PIL Image to base64 JPEG string
         
         Args:
             image: PIL Image
@@ -45,73 +146,267 @@ class ProductMatcher:
         Returns:
             Base64 encoded string
         """
-        buffer = io.BytesIO()
-        image.save(buffer, format='PNG')
-        img_str = base64.b64encode(buffer.getvalue()).decode()
-        return img_str
+        with self._encode_jpeg(image) as view:
+            return base64.b64encode(view).decode('ascii')
+    
+    def image_to_data_url(self, image: Image.Image) -> str:
+        """
+        Convert PIL Image to a JPEG data URL for the vision API
+        
+        Args:
+            image: PIL Image
+            
+        Returns:
+            data:image/jpeg;base64,... string
+        """
+        # Assembled as bytes so the payload isn't interpolated into another str
+        with self._encode_jpeg(image) as view:
+            return (b'data:image/jpeg;base64,' + base64.b64encode(view)).decode('ascii')
+    
+    def _encode_jpeg(self, image: Image.Image) -> memoryview:
+        """
+        Encode an image as JPEG, with libjpeg-turbo when available and
+        otherwise through PIL into this thread's reusable buffer
+        
+        Args:
+            image: PIL Image
+            
+        Returns:
+            View of the encoded bytes; release it (use as a context manager)
+            before the next encode on this thread
+        """
+        # GPT-4o downsamples to 768px anyway, so shrink before encoding
+        if image.mode != 'RGB' or max(image.size) > 768:
+            image = image.convert('RGB')
+            image.thumbnail((768, 768), Image.LANCZOS)
+        
+        if TURBOJPEG_AVAILABLE:
+            return memoryview(_turbo_jpeg.encode(np.asarray(image), quality=85, pixel_format=TJPF_RGB))
+        
+        buffer = getattr(self._tls, 'buffer', None)
+        if buffer is None:
+            buffer = self._tls.buffer = io.BytesIO()
+        buffer.seek(0)
+        buffer.truncate()
+        
+        image.save(buffer, format='JPEG', quality=85)
+        return buffer.getbuffer()
     
-    def match_product(self, image: Image.Image, context: str = "") -> Dict:
+    def match_product(self, image: Image.Image, context: str = "", cache_tag: str = "") -> Dict:
         """
         Match product in image using OpenAI GPT-4 Vision
         
         Args:
             image: PIL Image of the product
             context: Additional context about the image
+            cache_tag: Extra cache key part (e.g. the detected class); not
+                sent to the model
             
         Returns:
             Dictionary with match results
         """
         try:
-            # Convert image to base64
-            base64_image = self.image_to_base64(image)
+            # The same product usually persists across frames
+            image_hash = _dhash(np.asarray(image.convert('L')))
+            cached = self._cache_lookup(image_hash, context, cache_tag)
+            if cached is not None:
+                return cached
             
-            # Prepare prompt
-            prompt = self._create_matching_prompt(context)
+            return self._request_match(image_hash, image, context, cache_tag)
             
-            # Call OpenAI API
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a product identification expert. Analyze the image and provide detailed product information."
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": prompt
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/png;base64,{base64_image}"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=500,
-                temperature=0.1
-            )
+        except Exception as e:
+            logger.warning(f"Error matching product: {e}")
+            return self._error_result(e)
+    
+    def match_product_np(self, crop: np.ndarray, context: str = "", cache_tag: str = "") -> Dict:
+        """
+        Match product in a BGR crop, only building a PIL image on a cache miss
+        
+        Args:
+            crop: Cropped image (BGR format)
+            context: Additional context about the image
+            cache_tag: Extra cache key part (e.g. the detected class); not
+                sent to the model
+            
+        Returns:
+            Dictionary with match results
+        """
+        try:
+            image_hash = _dhash(cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY))
+            cached = self._cache_lookup(image_hash, context, cache_tag)
+            if cached is not None:
+                return cached
+            
+            image = Image.fromarray(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB))
+            return self._request_match(image_hash, image, context, cache_tag)
+            
+        except Exception as e:
+            logger.warning(f"Error matching product: {e}")
+            return self._error_result(e)
+    
+    def _request_match(self, image_hash: int, image: Image.Image, context: str, cache_tag: str) -> Dict:
+        """
+        Ask OpenAI to identify a crop and cache the parsed result
+        
+        Args:
+            image_hash: dHash of the crop
+            image: PIL Image of the product
+            context: Additional context about the image
+            cache_tag: Extra cache key part
+            
+        Returns:
+            Dictionary with match results
+        """
+        # Call OpenAI API
+        response = self.client.chat.completions.create(
+            **self._build_request(image, context)
+        )
+        
+        # Parse response
+        result = self._parse_matching_response(response.choices[0].message.content)
+        self._cache_store(image_hash, context, cache_tag, result)
+        
+        return result
+    
+    async def _match_product_async(self, client: AsyncOpenAI, semaphore: asyncio.Semaphore,
+                                   image: Image.Image, context: str = "") -> Dict:
+        """
+        Match product in image without blocking the event loop
+        
+        Args:
+            client: Shared async OpenAI client
+            semaphore: Bounds the number of requests in flight
+            image: PIL Image of the product
+            context: Additional context about the image
+            
+        Returns:
+            Dictionary with match results
+        """
+        try:
+            image_hash = _dhash(np.asarray(image.convert('L')))
+            cached = self._cache_lookup(image_hash, context, "")
+            if cached is not None:
+                return cached
+            
+            # Encode before taking a slot so CPU work doesn't hold one
+            request = self._build_request(image, context)
+            
+            async with semaphore:
+                response = await client.chat.completions.create(**request)
             
-            # Parse response
             result = self._parse_matching_response(response.choices[0].message.content)
+            self._cache_store(image_hash, context, "", result)
             
             return result
             
         except Exception as e:
-            print(f"Error matching product: {e}")
-            return {
-                "success": False,
-                "error": str(e),
-                "product_name": "Unknown",
-                "category": "unknown",
-                "confidence": 0.0,
-                "description": "",
-                "suggested_queries": []
-            }
+            logger.warning(f"Error matching product: {e}")
+            return self._error_result(e)
+    
+    def _cache_lookup(self, image_hash: int, context: str, cache_tag: str) -> Optional[Dict]:
+        """
+        Find a cached match for the same crop requested with the same context and tag
+        
+        Only exact hash hits count: a near-duplicate hash says nothing about
+        whether two crops show the same product.
+        
+        Args:
+            image_hash: dHash of the crop
+            context: Context string the match was requested with
+            cache_tag: Extra cache key part the match was requested with
+            
+        Returns:
+            Copy of the cached result, or None on a miss
+        """
+        key = (image_hash, context, cache_tag)
+        if key not in self._cache:
+            return None
+        
+        self._cache.move_to_end(key)
+        return dict(self._cache[key])
+    
+    def _cache_store(self, image_hash: int, context: str, cache_tag: str, result: Dict):
+        """
+        Remember a successful match, evicting the least recently used one
+        
+        Args:
+            image_hash: dHash of the crop
+            context: Context string the match was requested with
+            cache_tag: Extra cache key part the match was requested with
+            result: Parsed match result
+        """
+        if not result.get("success", False):
+            return
+        
+        key = (image_hash, context, cache_tag)
+        self._cache[key] = result
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+    
+    def _build_request(self, image: Image.Image, context: str) -> Dict:
+        """
+        Build chat completion arguments for a product image
+        
+        Args:
+            image: PIL Image of the product
+            context: Additional context about the image
+            
+        Returns:
+            Keyword arguments for chat.completions.create
+        """
+        # Convert image to a base64 data URL
+        image_url = self.image_to_data_url(image)
+        
+        # Prepare prompt
+        prompt = self._create_matching_prompt(context)
+        
+        return {
+            "model": "gpt-4o",
+            "messages": [
+                {
+                    "role": "system",
+                    "content": "You are a product identification expert. Analyze the image and provide detailed product information."
+                },
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": prompt
+                        },
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": image_url
+                            }
+                        }
+                    ]
+                }
+            ],
+            "max_tokens": 500,
+            "temperature": 0.1
+        }
+    
+    def _error_result(self, error: Exception) -> Dict:
+        """
+        Build the result returned when a match request fails
+        
+        Args:
+            error: Exception raised while matching
+            
+        Returns:
+            Failed match result dictionary
+        """
+        return {
+            "success": False,
+            "error": str(error),
+            "product_name": "Unknown",
+            "category": "unknown",
+            "confidence": 0.0,
+            "description": "",
+            "suggested_queries": []
+        }
     
     def _create_matching_prompt(self, context: str) -> str:
         """
@@ -154,33 +449,19 @@ class ProductMatcher:
             Parsed result dictionary
         """
         try:
-            # Try to extract JSON from response
-            import json
-            import re
-            
             # Find JSON in response
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
+            json_match = _JSON_RE.search(response)
             if json_match:
-                json_str = json_match.group()
-                result = json.loads(json_str)
-                
-                # Ensure required fields
-                result.setdefault("success", True)
-                result.setdefault("product_name", "Unknown")
-                result.setdefault("category", "unknown")
-                result.setdefault("confidence", 0.0)
-                result.setdefault("description", "")
-                result.setdefault("brand", "")
-                result.setdefault("color", "")
-                result.setdefault("suggested_queries", [])
+                result = json.loads(json_match.group())
                 
-                return result
+                # Ensure required fields (fresh list so results never share one)
+                return {**_DEFAULTS, "suggested_queries": [], **result}
             else:
                 # Fallback parsing
                 return self._fallback_parsing(response)
                 
         except Exception as e:
-            print(f"Error parsing response: {e}")
+            logger.warning(f"Error parsing response: {e}")
             return self._fallback_parsing(response)
     
     def _fallback_parsing(self, response: str) -> Dict:
@@ -196,23 +477,30 @@ class ProductMatcher:
         # Simple keyword extraction
         response_lower = response.lower()
         
-        # Extract product name (look for common patterns)
+        # Extract product name and category (look for common patterns);
+        # earlier keywords win when several appear
         product_name = "Unknown"
-        if "nike" in response_lower:
-            product_name = "Nike Product"
-        elif "adidas" in response_lower:
-            product_name = "Adidas Product"
-        elif "iphone" in response_lower:
-            product_name = "iPhone"
-        elif "samsung" in response_lower:
-            product_name = "Samsung Product"
-        
-        # Extract category
         category = "unknown"
-        for cat in self.product_categories:
-            if cat in response_lower:
-                category = cat
-                break
+        
+        if self._keyword_automaton is not None:
+            # One pass over the response for every keyword
+            brand_rank = category_rank = None
+            for _, (kind, priority, label) in self._keyword_automaton.iter(response_lower):
+                if kind == "brand":
+                    if brand_rank is None or priority < brand_rank:
+                        brand_rank, product_name = priority, label
+                elif category_rank is None or priority < category_rank:
+                    category_rank, category = priority, label
+        else:
+            for keyword, name in _BRAND_PRODUCTS.items():
+                if keyword in response_lower:
+                    product_name = name
+                    break
+            
+            for cat in self.product_categories:
+                if cat in response_lower:
+                    category = cat
+                    break
         
         return {
             "success": True,
@@ -237,17 +525,33 @@ class ProductMatcher:
         Returns:
             List of match results
         """
+        return asyncio.run(self.batch_match_products_async(images, contexts))
+    
+    async def batch_match_products_async(self, images: List[Image.Image],
+                                         contexts: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Match multiple products concurrently
+        
+        Args:
+            images: List of PIL Images
+            contexts: Optional list of context strings
+            
+        Returns:
+            List of match results, in input order
+        """
         if contexts is None:
             contexts = [""] * len(images)
         
-        results = []
-        
-        for i, (image, context) in enumerate(zip(images, contexts)):
-            print(f"Matching product {i+1}/{len(images)}...")
-            result = self.match_product(image, context)
-            results.append(result)
+        logger.debug("Matching %d products...", len(images))
         
-        return results
+        # One client per batch so its connection pool lives on this event loop
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_MATCHES)
+        http_client = httpx.AsyncClient(http2=HTTP2_AVAILABLE, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+        async with AsyncOpenAI(api_key=self.api_key, http_client=http_client) as client:
+            return await asyncio.gather(*(
+                self._match_product_async(client, semaphore, image, context)
+                for image, context in zip(images, contexts)
+            ))
     
     def get_affiliate_suggestions(self, product_info: Dict) -> List[str]:
         """
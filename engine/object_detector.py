@@ -4,31 +4,282 @@ Runs YOLOv8 for object detection
 """
 
 import os
+import logging
 import numpy as np
+import torch
+import torch.nn.functional as F
+from dataclasses import dataclass
 from typing import List, Tuple, Dict, Optional
 from ultralytics import YOLO
 import cv2
 from PIL import Image
 
+logger = logging.getLogger(__name__)
+
+# Largest batch the exported TensorRT engine accepts
+MAX_BATCH = 32
+
+# Largest mAP50-95 loss accepted for an INT8 engine before keeping FP16
+INT8_MAX_MAP_DROP = 0.01
+
+@dataclass
+class Detections:
+    """
+    Detections for one frame as parallel arrays (structure of arrays)
+    
+    Indexing with a boolean mask or index array returns the matching subset.
+    """
+    boxes: np.ndarray      # (N, 4) int32 x1, y1, x2, y2
+    scores: np.ndarray     # (N,) float32
+    class_ids: np.ndarray  # (N,) int32
+    names: List[str]       # class id -> class name
+    
+    def __len__(self) -> int:
+        return len(self.scores)
+    
+    def __getitem__(self, index) -> "Detections":
+        return Detections(self.boxes[index], self.scores[index], self.class_ids[index], self.names)
+    
+    def to_dict(self, i: int) -> Dict:
+        """
+        Build the detection dictionary for row i
+        
+        Args:
+            i: Row index
+            
+        Returns:
+            Detection dictionary with bbox, confidence, and class
+        """
+        class_id = int(self.class_ids[i])
+        return {
+            "bbox": tuple(self.boxes[i].tolist()),
+            "confidence": float(self.scores[i]),
+            "class_id": class_id,
+            "class_name": self.names[class_id]
+        }
+    
+    def to_dicts(self) -> List[Dict]:
+        """
+        Build detection dictionaries for every row
+        
+        Returns:
+            List of detection dictionaries with bbox, confidence, and class
+        """
+        names = self.names
+        
+        return [
+            {
+                "bbox": (x1, y1, x2, y2),
+                "confidence": confidence,
+                "class_id": class_id,
+                "class_name": names[class_id]
+            }
+            for (x1, y1, x2, y2), confidence, class_id in zip(
+                self.boxes.tolist(), self.scores.tolist(), self.class_ids.tolist()
+            )
+        ]
+
 class ObjectDetector:
-    def __init__(self, model_path: str = "yolov8n.pt", confidence_threshold: float = 0.5):
+    def __init__(self, model_path: str = "yolov8n.pt", confidence_threshold: float = 0.5,
+                 int8_data: Optional[str] = None):
         """
         Initialize object detector
         
         Args:
             model_path: Path to YOLO model file
             confidence_threshold: Minimum confidence for detections
+            int8_data: Dataset YAML of representative frames; when given on
+                GPU, an INT8 engine is calibrated on it and used if accurate enough
         """
         self.confidence_threshold = confidence_threshold
+        self.int8_data = int8_data
+        self.half = False
+        
+        # Device for staged input tensors. YOLO.device is None for exported
+        # TensorRT/ONNX models, whose model attribute is only a path, so it
+        # can't be used to place inputs
+        self.device = torch.device('cuda', 0) if torch.cuda.is_available() else torch.device('cpu')
+        
+        # Reusable output frame for draw_detections
+        self._draw_buf = None
+        
+        # Two page-locked letterbox staging buffers for batched GPU inference,
+        # and the stream their uploads run on
+        self._pinned = None
+        self._pinned_np = None
+        self._copy_stream = None
         
         # Load YOLO model
         try:
-            self.model = YOLO(model_path)
-            print(f"✅ YOLO model loaded: {model_path}")
+            self.model = self._load_model(model_path)
+            # Class names as a plain list, indexed by class id
+            self._names = [self.model.names[i] for i in range(len(self.model.names))]
+            logger.info(f"✅ YOLO model loaded: {model_path}")
+        except Exception as e:
+            logger.error(f"❌ Error loading YOLO model: {e}")
+            raise
+        
+        self.warm_up()
+    
+    def warm_up(self):
+        """
+        Run dummy inferences so CUDA context setup, cuDNN autotuning and
+        TensorRT profile selection happen before the first real frame
+        """
+        dummy = np.zeros((640, 640, 3), dtype=np.uint8)
+        
+        for _ in range(3):
+            self.detect_objects(dummy)
+        
+        if torch.cuda.is_available():
+            # Also the largest batch the dynamic engine (and pinned staging) will see
+            self.detect_objects_batch([dummy] * MAX_BATCH)
+    
+    def _load_model(self, model_path: str) -> YOLO:
+        """
+        Load YOLO weights, preferring a cached TensorRT FP16 engine with
+        built-in NMS on GPU
+        
+        Args:
+            model_path: Path to YOLO model file
+            
+        Returns:
+            Loaded YOLO model
+        """
+        if not model_path.endswith('.pt'):
+            return YOLO(model_path)
+        
+        if not torch.cuda.is_available():
+            return self._load_cpu_model(model_path)
+        
+        # FP16 only pays off on tensor-core GPUs (Volta and newer); skip Pascal
+        tensor_cores = torch.cuda.get_device_capability(0)[0] >= 7
+        
+        # NMS is compiled into the engine, so predict skips the host-side pass
+        engine_path = model_path.replace('.pt', f'_fp16_b{MAX_BATCH}_nms.engine')
+        
+        try:
+            if not os.path.exists(engine_path):
+                self._export_once(engine_path, lambda: self._export_engine(model_path, engine_path, half=True))
+            
+            if self.int8_data:
+                int8_path = self._load_int8_engine(model_path, engine_path)
+                if int8_path:
+                    return YOLO(int8_path, task='detect')
+            
+            return YOLO(engine_path, task='detect')
+        except Exception as e:
+            logger.warning(f"⚠️ TensorRT export failed, using PyTorch weights: {e}")
+            self.half = tensor_cores
+            return YOLO(model_path)
+    
+    def _load_cpu_model(self, model_path: str) -> YOLO:
+        """
+        Load YOLO weights as a dynamically quantized INT8 ONNX model for CPU
+        
+        Args:
+            model_path: Path to YOLO .pt weights
+            
+        Returns:
+            YOLO model backed by onnxruntime, or the PyTorch weights if
+            onnxruntime isn't installed
+        """
+        onnx_path = model_path.replace('.pt', '_int8.onnx')
+        
+        try:
+            if not os.path.exists(onnx_path):
+                from onnxruntime.quantization import quantize_dynamic, QuantType
+                
+                def export():
+                    logger.info(f"⚙️ Exporting INT8 ONNX model: {onnx_path}")
+                    exported = YOLO(model_path).export(format='onnx', dynamic=True, simplify=True, imgsz=640)
+                    quantize_dynamic(str(exported), onnx_path, weight_type=QuantType.QUInt8)
+                
+                self._export_once(onnx_path, export)
+            return YOLO(onnx_path, task='detect')
+        except Exception as e:
+            logger.warning(f"⚠️ INT8 ONNX model unavailable, using PyTorch weights: {e}")
+            return YOLO(model_path)
+    
+    def _export_once(self, target_path: str, export):
+        """
+        Run an export unless an earlier attempt at the same target failed
+        
+        A failed export leaves a .failed marker (holding the error) next to
+        the target, so later detectors fall back straight away instead of
+        retrying an export that can take minutes. Delete it to retry.
+        
+        Args:
+            target_path: Path the export writes
+            export: Callable that performs the export
+            
+        Raises:
+            RuntimeError: If an earlier export of target_path failed
+        """
+        failed_path = target_path + '.failed'
+        if os.path.exists(failed_path):
+            raise RuntimeError(f"earlier export failed, delete {failed_path} to retry")
+        
+        try:
+            export()
         except Exception as e:
-            print(f"❌ Error loading YOLO model: {e}")
+            with open(failed_path, 'w') as f:
+                f.write(f"{e}\n")
             raise
     
+    def _export_engine(self, model_path: str, engine_path: str, **kwargs):
+        """
+        Export YOLO weights to a dynamic-batch TensorRT engine with built-in NMS
+        
+        Args:
+            model_path: Path to YOLO .pt weights
+            engine_path: Where to cache the engine
+            **kwargs: Precision options passed to export (half / int8, data)
+        """
+        logger.info(f"⚙️ Exporting TensorRT engine: {engine_path}")
+        exported = YOLO(model_path).export(
+            format='engine', dynamic=True, nms=True,
+            batch=MAX_BATCH, imgsz=640, device=0, workspace=4, **kwargs
+        )
+        os.replace(exported, engine_path)
+    
+    def _load_int8_engine(self, model_path: str, fp16_path: str) -> Optional[str]:
+        """
+        Build (once) an INT8 engine calibrated on self.int8_data and keep it
+        only if its accuracy is within INT8_MAX_MAP_DROP of the FP16 engine
+        
+        Args:
+            model_path: Path to YOLO .pt weights
+            fp16_path: Path of the FP16 engine to compare against
+            
+        Returns:
+            Path to the INT8 engine, or None to stay on FP16
+        """
+        int8_path = model_path.replace('.pt', f'_int8_b{MAX_BATCH}_nms.engine')
+        # Marks an INT8 engine that failed the accuracy check, so it isn't rebuilt every start
+        rejected_path = int8_path + '.rejected'
+        
+        if os.path.exists(rejected_path):
+            return None
+        if os.path.exists(int8_path):
+            return int8_path
+        
+        try:
+            self._export_once(int8_path, lambda: self._export_engine(model_path, int8_path, int8=True, data=self.int8_data))
+            
+            int8_map = YOLO(int8_path, task='detect').val(data=self.int8_data, batch=MAX_BATCH, verbose=False).box.map
+            fp16_map = YOLO(fp16_path, task='detect').val(data=self.int8_data, batch=MAX_BATCH, verbose=False).box.map
+        except Exception as e:
+            logger.warning(f"⚠️ INT8 calibration failed, using FP16 engine: {e}")
+            return None
+        
+        if fp16_map - int8_map > INT8_MAX_MAP_DROP:
+            logger.warning(f"⚠️ INT8 mAP {int8_map:.3f} vs FP16 {fp16_map:.3f}, keeping FP16 engine")
+            os.replace(int8_path, rejected_path)
+            return None
+        
+        return int8_path
+    
     def detect_objects(self, frame: np.ndarray) -> List[Dict]:
         """
         Detect objects in a frame
@@ -44,44 +295,266 @@ class ObjectDetector:
             results = self.model.predict(
                 source=frame,
                 conf=self.confidence_threshold,
+                half=self.half,
                 verbose=False
             )
             
-            detections = []
-            
             if results and len(results) > 0:
-                result = results[0]  # Get first result
-                
-                if result.boxes is not None:
-                    boxes = result.boxes
-                    
-                    for i in range(len(boxes)):
-                        # Get bounding box coordinates
-                        bbox = boxes.xyxy[i].cpu().numpy()
-                        x1, y1, x2, y2 = map(int, bbox)
-                        
-                        # Get confidence
-                        confidence = float(boxes.conf[i].cpu().numpy())
-                        
-                        # Get class
-                        class_id = int(boxes.cls[i].cpu().numpy())
-                        class_name = self.model.names[class_id]
-                        
-                        detection = {
-                            "bbox": (x1, y1, x2, y2),
-                            "confidence": confidence,
-                            "class_id": class_id,
-                            "class_name": class_name
-                        }
-                        
-                        detections.append(detection)
+                return self._extract_detections(results[0])
             
-            return detections
+            return []
             
         except Exception as e:
-            print(f"Error during object detection: {e}")
+            logger.error(f"Error during object detection: {e}")
             return []
     
+    def detect_objects_batch(self, frames: List[np.ndarray], imgsz: int = 640) -> List[List[Dict]]:
+        """
+        Detect objects in several frames with a single YOLO call
+        
+        Args:
+            frames: List of input frames (numpy arrays)
+            imgsz: Inference size every frame is letterboxed to
+            
+        Returns:
+            One list of detection dictionaries per input frame
+        """
+        return [detections.to_dicts() for detections in self.detect_objects_batch_arrays(frames, imgsz)]
+    
+    def detect_objects_batch_arrays(self, frames: List[np.ndarray], imgsz: int = 640) -> List[Detections]:
+        """
+        Detect objects in several frames with a single YOLO call, keeping
+        each frame's detections as arrays
+        
+        Args:
+            frames: List of input frames (numpy arrays)
+            imgsz: Inference size every frame is letterboxed to
+            
+        Returns:
+            One Detections per input frame
+            
+        Raises:
+            Any staging or inference error; an empty result would be
+            indistinguishable from frames with nothing in them
+        """
+        if not frames:
+            return []
+        
+        detections = []
+        
+        # One predict call per chunk so the frames run as a single NCHW
+        # batch, capped at the batch size the TensorRT engine was built for
+        chunks = [frames[start:start + MAX_BATCH] for start in range(0, len(frames), MAX_BATCH)]
+        
+        if self.device.type != 'cuda':
+            for chunk in chunks:
+                results = self.model.predict(
+                    source=list(chunk),
+                    conf=self.confidence_threshold,
+                    imgsz=imgsz,
+                    half=self.half,
+                    verbose=False
+                )
+                detections.extend(self._extract_arrays(result) for result in results)
+            return detections
+        
+        # Double buffering: chunk i+1 is uploaded on the copy stream while
+        # chunk i runs on the compute stream
+        pending = self._upload_chunk(0, chunks[0], imgsz)
+        for i in range(len(chunks)):
+            batch, letterboxes, ready = pending
+            if i + 1 < len(chunks):
+                pending = self._upload_chunk((i + 1) % 2, chunks[i + 1], imgsz)
+            
+            compute_stream = torch.cuda.current_stream()
+            compute_stream.wait_event(ready)
+            # Allocated on the copy stream; keep it alive until compute is done with it
+            batch.record_stream(compute_stream)
+            batch = batch.permute(0, 3, 1, 2).flip(1).float().div_(255).contiguous()
+            
+            results = self.model.predict(
+                source=batch,
+                conf=self.confidence_threshold,
+                imgsz=imgsz,
+                half=self.half,
+                verbose=False
+            )
+            detections.extend(
+                self._extract_arrays(result, letterbox)
+                for result, letterbox in zip(results, letterboxes)
+            )
+        
+        return detections
+    
+    def _upload_chunk(self, buffer: int, chunk: List[np.ndarray], imgsz: int):
+        """
+        Letterbox a chunk into a pinned staging buffer and start its upload
+        on the copy stream
+        
+        Args:
+            buffer: Which of the two staging buffers to fill
+            chunk: Frames to upload (at most MAX_BATCH)
+            imgsz: Inference size every frame is letterboxed to
+            
+        Returns:
+            Tuple of (device uint8 NHWC batch, letterbox params, upload-done event)
+        """
+        if self._pinned is None or self._pinned.shape[2] != imgsz:
+            # uint8 keeps the pinned allocation 4x smaller; the float conversion happens on device
+            self._pinned = torch.empty((2, MAX_BATCH, imgsz, imgsz, 3), dtype=torch.uint8).pin_memory()
+            self._pinned_np = self._pinned.numpy()
+            self._copy_stream = torch.cuda.Stream()
+        
+        letterboxes = [self._letterbox_into(buffer, i, frame, imgsz) for i, frame in enumerate(chunk)]
+        
+        with torch.cuda.stream(self._copy_stream):
+            batch = self._pinned[buffer, :len(chunk)].to(self.device, non_blocking=True)
+            ready = torch.cuda.Event()
+            ready.record(self._copy_stream)
+        
+        return batch, letterboxes, ready
+    
+    def _letterbox_into(self, buffer: int, index: int, frame: np.ndarray,
+                        imgsz: int) -> Tuple[float, int, int, int, int]:
+        """
+        Letterbox a frame into slot `index` of a pinned staging buffer
+        
+        Args:
+            buffer: Which of the two staging buffers to write
+            index: Batch slot to write
+            frame: Input frame (numpy array, BGR)
+            imgsz: Square size of the staging buffer
+            
+        Returns:
+            Tuple of (scale, pad_x, pad_y, width, height) to map boxes back
+        """
+        height, width = frame.shape[:2]
+        scale = imgsz / max(height, width)
+        new_w, new_h = round(width * scale), round(height * scale)
+        pad_x, pad_y = (imgsz - new_w) // 2, (imgsz - new_h) // 2
+        
+        canvas = self._pinned_np[buffer, index]
+        canvas.fill(114)
+        # INTER_AREA when shrinking large sources: alias-free, and the only
+        # resize the frame gets before upload
+        canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = cv2.resize(
+            frame, (new_w, new_h), interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+        )
+        
+        return scale, pad_x, pad_y, width, height
+    
+    def upload_frame(self, frame: np.ndarray) -> torch.Tensor:
+        """
+        Copy a BGR frame to the detector's device once, for the GPU-resident path
+        
+        Args:
+            frame: Input frame (numpy array, BGR)
+            
+        Returns:
+            RGB float tensor of shape (3, H, W) in [0, 1] on the detector's device
+        """
+        tensor = torch.from_numpy(frame).to(self.device, non_blocking=True)
+        return tensor.flip(-1).permute(2, 0, 1).float().div_(255)
+    
+    def detect_objects_gpu(self, frame_tensor: torch.Tensor,
+                           imgsz: int = 640) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        Detect objects without copying results back to the host
+        
+        Args:
+            frame_tensor: Frame from upload_frame
+            imgsz: Inference size the frame is letterboxed to
+            
+        Returns:
+            Tuple of (boxes, confidences, class_ids) tensors on the device,
+            boxes as (x1, y1, x2, y2) in frame coordinates
+        """
+        height, width = frame_tensor.shape[1:]
+        
+        # Letterbox on the device: tensor sources must already be stride-aligned
+        scale = imgsz / max(height, width)
+        new_h, new_w = round(height * scale), round(width * scale)
+        pad_x, pad_y = (imgsz - new_w) // 2, (imgsz - new_h) // 2
+        resized = F.interpolate(frame_tensor[None], size=(new_h, new_w), mode='bilinear', align_corners=False)
+        batch = F.pad(resized, (pad_x, imgsz - new_w - pad_x, pad_y, imgsz - new_h - pad_y), value=114 / 255)
+        
+        results = self.model.predict(
+            source=batch,
+            conf=self.confidence_threshold,
+            imgsz=imgsz,
+            half=self.half,
+            verbose=False
+        )
+        
+        data = results[0].boxes.data
+        offset = data.new_tensor([pad_x, pad_y, pad_x, pad_y])
+        boxes = (data[:, :4] - offset) / scale
+        boxes[:, 0::2].clamp_(0, width)
+        boxes[:, 1::2].clamp_(0, height)
+        
+        return boxes, data[:, 4], data[:, 5].long()
+    
+    def _extract_detections(self, result,
+                            letterbox: Optional[Tuple[float, int, int, int, int]] = None) -> List[Dict]:
+        """
+        Convert a single YOLO result into detection dictionaries
+        
+        Args:
+            result: YOLO result for one frame
+            letterbox: (scale, pad_x, pad_y, width, height) from _letterbox_into
+                when the frame was letterboxed before predict
+            
+        Returns:
+            List of detection dictionaries with bbox, confidence, and class
+        """
+        return self._extract_arrays(result, letterbox).to_dicts()
+    
+    def _extract_arrays(self, result,
+                        letterbox: Optional[Tuple[float, int, int, int, int]] = None) -> Detections:
+        """
+        Convert a single YOLO result into a Detections array set
+        
+        Args:
+            result: YOLO result for one frame
+            letterbox: (scale, pad_x, pad_y, width, height) from _letterbox_into
+                when the frame was letterboxed before predict
+            
+        Returns:
+            Detections for the frame
+        """
+        if result.boxes is None:
+            return self._empty_detections()
+        
+        # Copy all boxes off the device in one transfer:
+        # rows are (x1, y1, x2, y2, confidence, class)
+        data = result.boxes.data.cpu().numpy()
+        boxes = data[:, :4]
+        if letterbox is not None:
+            scale, pad_x, pad_y, width, height = letterbox
+            boxes = (boxes - (pad_x, pad_y, pad_x, pad_y)) / scale
+            boxes = np.clip(boxes, 0, (width, height, width, height))
+        
+        return Detections(
+            boxes=boxes.astype(np.int32),
+            scores=data[:, -2].astype(np.float32),
+            class_ids=data[:, -1].astype(np.int32),
+            names=self._names
+        )
+    
+    def _empty_detections(self) -> Detections:
+        """
+        Create a Detections set with no rows
+        
+        Returns:
+            Empty Detections
+        """
+        return Detections(
+            boxes=np.empty((0, 4), dtype=np.int32),
+            scores=np.empty(0, dtype=np.float32),
+            class_ids=np.empty(0, dtype=np.int32),
+            names=self._names
+        )
+    
     def filter_detections(self, detections: List[Dict], 
                          min_confidence: Optional[float] = None,
                          classes: Optional[List[str]] = None) -> List[Dict]:
@@ -96,20 +569,22 @@ class ObjectDetector:
         Returns:
             Filtered list of detections
         """
-        filtered = detections
-        
-        # Filter by confidence
-        if min_confidence is not None:
-            filtered = [d for d in filtered if d["confidence"] >= min_confidence]
+        if min_confidence is None and classes is None:
+            return detections
         
-        # Filter by class
-        if classes is not None:
-            filtered = [d for d in filtered if d["class_name"] in classes]
+        # Single pass over detections; class membership is a set lookup
+        threshold = min_confidence if min_confidence is not None else float("-inf")
+        allowed = set(classes) if classes is not None else None
         
-        return filtered
+        return [
+            d for d in detections
+            if d["confidence"] >= threshold
+            and (allowed is None or d["class_name"] in allowed)
+        ]
     
     def draw_detections(self, frame: np.ndarray, detections: List[Dict], 
-                       draw_labels: bool = True) -> np.ndarray:
+                       draw_labels: bool = True,
+                       out: Optional[np.ndarray] = None) -> np.ndarray:
         """
         Draw detection bounding boxes on frame
         
@@ -117,11 +592,20 @@ class ObjectDetector:
             frame: Input frame
             detections: List of detections
             draw_labels: Whether to draw class labels
+            out: Buffer to draw into; defaults to an internal buffer reused
+                across calls, so the returned frame is overwritten by the next call
             
         Returns:
             Frame with drawn detections
         """
-        frame_copy = frame.copy()
+        if out is None or out.shape != frame.shape or out.dtype != frame.dtype:
+            buf = self._draw_buf
+            if buf is None or buf.shape != frame.shape or buf.dtype != frame.dtype:
+                buf = self._draw_buf = np.empty_like(frame)
+            out = buf
+        
+        np.copyto(out, frame)
+        frame_copy = out
         
         for detection in detections:
             bbox = detection["bbox"]
@@ -5,22 +5,138 @@ Main orchestrator that coordinates all components
 
 import os
 import time
-from typing import List, Dict, Optional
+import logging
+import queue
+import threading
+import multiprocessing
+from collections import deque
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
+import cv2
+import numpy as np
 from dotenv import load_dotenv
 
 from video_processor import VideoProcessor
-from object_detector import ObjectDetector
+from object_detector import ObjectDetector, Detections
 from cropper import Cropper
 from matcher import ProductMatcher
 from supabase_client import SupabaseClient
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Frames sent to the detector in one batched YOLO call
+DETECTION_BATCH_SIZE = 8
+
+# Batches allowed to wait between two pipeline stages
+STAGE_QUEUE_SIZE = 2
+
+# Background threads issuing database writes, and how many saved matches
+# may be in flight before the pipeline waits for them
+DB_WRITER_THREADS = 4
+MAX_PENDING_WRITES = 256
+
+# Crop matches a pipeline remembers; a whole video's tracked objects
+# should fit so they are identified once
+PIPELINE_MATCH_CACHE_SIZE = 2048
+
+# Frames whose dHash differs by fewer bits than this reuse the previous
+# frame's detections; detection is forced at least every N frames
+FRAME_HASH_DISTANCE = 4
+DETECTION_REFRESH_INTERVAL = 10
+
+# End-of-stream marker passed between pipeline stages
+_STOP = object()
+
+def _frame_signatures(frames: List[np.ndarray]) -> List[int]:
+    """64-bit difference hashes of a batch of BGR frames, used to spot near-duplicate frames"""
+    # Only the downsample is per frame; the comparison and bit packing run
+    # once over the whole (B, 8, 9) stack
+    small = np.stack([
+        cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (9, 8), interpolation=cv2.INTER_AREA)
+        for frame in frames
+    ])
+    bits = (small[:, :, 1:] > small[:, :, :-1]).reshape(len(frames), 64)
+    return np.packbits(bits, axis=1).view('>u8').ravel().tolist()
+
+def _crop_and_match(cropper: Cropper, matcher: ProductMatcher, frame, detections: Detections) -> List[Tuple]:
+    """
+    Crop detections from a frame and match each crop to a product
+    
+    Args:
+        cropper: Cropper to cut the detections with
+        matcher: Matcher to identify the crops with
+        frame: Input frame
+        detections: Detections for the frame
+        
+    Returns:
+        List of (detection, match_result); detection["crop"] is the BGR crop
+    """
+    if not len(detections):
+        return []
+    
+    # Crop and match straight from the arrays; a detection dictionary is
+    # only built for crops that are actually matched, and PIL images only
+    # for matches that get saved
+    kept, crops = cropper.crop_batch(frame, detections)
+    
+    results = []
+    for i, crop in enumerate(crops):
+        detection = {**kept.to_dict(i), "crop": crop}
+        # Tag the cache with the class so cached matches never cross classes
+        results.append((detection, matcher.match_product_np(crop, cache_tag=detection["class_name"])))
+    return results
+
+# Per-process components for crop + match workers
+_worker_cropper = None
+_worker_matcher = None
+
+def _init_match_worker():
+    """Create the cropper and matcher once per worker process"""
+    global _worker_cropper, _worker_matcher
+    # The pool already spreads frames across processes
+    VideoProcessor.configure_threads('per-frame')
+    _worker_cropper = Cropper()
+    _worker_matcher = ProductMatcher(cache_size=PIPELINE_MATCH_CACHE_SIZE)
+
+def _crop_and_match_frames(items: List[Tuple]) -> List[Tuple]:
+    """
+    Crop and match a chunk of frames in a worker process
+    
+    Frames are read in place from the pipeline's shared-memory slots, so
+    only the slot name, shape and detections cross the process boundary.
+    
+    Args:
+        items: List of (frame_num, slot_name, shape, detections)
+        
+    Returns:
+        List of (frame_num, [(detection, match_result), ...])
+    """
+    results = []
+    for frame_num, slot_name, shape, detections in items:
+        slot = shared_memory.SharedMemory(name=slot_name)
+        try:
+            frame = np.ndarray(shape, dtype=np.uint8, buffer=slot.buf)
+            matches = _crop_and_match(_worker_cropper, _worker_matcher, frame, detections)
+            # Crops are views into the slot, which the pipeline reuses for
+            # the next batch; copy them out before letting go of it
+            for detection, _ in matches:
+                detection["crop"] = detection["crop"].copy()
+            del frame
+        finally:
+            slot.close()
+        results.append((frame_num, matches))
+    return results
+
 class LokalPipeline:
     def __init__(self, 
                  frame_rate: int = 30,
                  confidence_threshold: float = 0.5,
-                 model_path: str = "yolov8n.pt"):
+                 model_path: str = "yolov8n.pt",
+                 num_workers: int = 1,
+                 allowed_classes: Optional[List[str]] = None):
         """
         Initialize Lokal pipeline
         
@@ -28,9 +144,22 @@ class LokalPipeline:
             frame_rate: Frames to skip between extractions
             confidence_threshold: YOLO confidence threshold
             model_path: Path to YOLO model
+            num_workers: Processes for the crop + match stage; 1 keeps it
+                on the pipeline's own thread
+            allowed_classes: Class names worth matching; None keeps every class
         """
         self.frame_rate = frame_rate
         self.confidence_threshold = confidence_threshold
+        self.num_workers = num_workers
+        
+        # Started on first use so single-worker pipelines never pay for it
+        self._match_pool = None
+        # Shared-memory frame buffers handed to the match workers, reused
+        # for every batch of a video
+        self._frame_slots = []
+        
+        # Database writes are network-bound; run them off the pipeline loop
+        self._db_writer = ThreadPoolExecutor(max_workers=DB_WRITER_THREADS, thread_name_prefix="db-writer")
         
         # Initialize components
         self.video_processor = VideoProcessor(frame_rate=frame_rate)
@@ -39,10 +168,24 @@ class LokalPipeline:
             confidence_threshold=confidence_threshold
         )
         self.cropper = Cropper()
-        self.matcher = ProductMatcher()
+        self.matcher = ProductMatcher(cache_size=PIPELINE_MATCH_CACHE_SIZE)
         self.supabase = SupabaseClient()
         
-        print("✅ Lokal Pipeline initialized successfully")
+        # Allowed class ids as an array so relevance is one np.isin per frame
+        self._allowed_class_ids = None
+        if allowed_classes is not None:
+            allowed = set(allowed_classes)
+            names = self.object_detector.get_available_classes()
+            self._allowed_class_ids = np.array(
+                [class_id for class_id, name in enumerate(names) if name in allowed], dtype=np.int32
+            )
+        
+        # Last detected frame, for skipping detection on near-identical frames
+        self._last_signature = None
+        self._last_detections = None
+        self._frames_since_detection = 0
+        
+        logger.info("✅ Lokal Pipeline initialized successfully")
     
     def process_video(self, video_path: str, user_id: str) -> Dict:
         """
@@ -58,62 +201,77 @@ class LokalPipeline:
         start_time = time.time()
         
         try:
-            print(f"🎬 Starting video processing: {video_path}")
+            logger.info(f"🎬 Starting video processing: {video_path}")
             
             # Step 1: Save video record to database
             video_id = self.supabase.save_video_record(video_path, user_id)
-            print(f"📝 Video record saved with ID: {video_id}")
+            logger.info(f"📝 Video record saved with ID: {video_id}")
             
             # Step 2: Get video information
             video_info = self.video_processor.get_video_info(video_path)
-            print(f"📊 Video info: {video_info['frame_count']} frames, {video_info['duration']:.2f}s")
+            logger.info(f"📊 Video info: {video_info['frame_count']} frames, {video_info['duration']:.2f}s")
             
-            # Step 3: Process frames
+            self._last_signature = None
+            
+            # Step 3: Process frames as a pipeline: capture, detection and
+            # crop + match each run on their own thread, and database writes
+            # are handed to background writers from here, so GPU, CPU and
+            # network work overlap across frames
             total_detections = 0
             total_matches = 0
             processed_frames = 0
             
-            for frame_num, frame in self.video_processor.extract_frames(video_path):
-                print(f"🖼️  Processing frame {frame_num + 1}...")
-                
-                # Detect objects
-                detections = self.object_detector.detect_objects(frame)
+            errors = []
+            pending_writes = deque()
+            frame_queue = queue.Queue(maxsize=STAGE_QUEUE_SIZE)
+            detection_queue = queue.Queue(maxsize=STAGE_QUEUE_SIZE)
+            match_queue = queue.Queue(maxsize=STAGE_QUEUE_SIZE)
+            
+            stages = [
+                threading.Thread(target=self._capture_stage, args=(video_path, frame_queue, errors), daemon=True),
+                threading.Thread(target=self._run_stage, args=(self._detect_batch, frame_queue, detection_queue, errors), daemon=True),
+                threading.Thread(target=self._run_stage, args=(self._match_batch, detection_queue, match_queue, errors), daemon=True),
+            ]
+            for stage in stages:
+                stage.start()
+            
+            while True:
+                item = match_queue.get()
+                if item is _STOP:
+                    break
+                if errors:
+                    continue
                 
-                if detections:
-                    # Crop detected objects
-                    cropped_detections = self.cropper.crop_detections(frame, detections)
-                    
-                    for detection in cropped_detections:
-                        # Convert crop to PIL Image for matching
-                        pil_crop = self.cropper.crop_to_pil(detection["crop"])
-                        
-                        # Match product
-                        match_result = self.matcher.match_product(pil_crop)
-                        
-                        if match_result.get("success", False):
-                            # Save detection to database
-                            detection_id = self.supabase.save_detection(
-                                video_id=video_id,
-                                label=detection["class_name"],
-                                bbox=detection["bbox"]
-                            )
-                            
-                            # Upload crop image
-                            crop_url = self.supabase.upload_crop_image(pil_crop, detection_id)
+                try:
+                    for frame_num, matches in item:
+                        for detection, match_result in matches:
+                            if match_result.get("success", False):
+                                pending_writes.append(
+                                    self._db_writer.submit(self._save_match, video_id, detection, match_result)
+                                )
+                                # Back-pressure, and surfaces write failures early
+                                while len(pending_writes) > MAX_PENDING_WRITES:
+                                    pending_writes.popleft().result()
+                                
+                                total_matches += 1
+                                if logger.isEnabledFor(logging.DEBUG):
+                                    logger.debug(f"✅ Matched: {match_result['product_name']} (confidence: {match_result['confidence']:.2f})")
                             
-                            # Save matched product
-                            product_id = self.supabase.save_matched_product(
-                                object_id=detection_id,
-                                label=match_result["product_name"],
-                                match_type="auto"
-                            )
-                            
-                            total_matches += 1
-                            print(f"✅ Matched: {match_result['product_name']} (confidence: {match_result['confidence']:.2f})")
+                            total_detections += 1
                         
-                        total_detections += 1
-                
-                processed_frames += 1
+                        processed_frames += 1
+                except Exception as e:
+                    # Keep draining so the stage threads can finish
+                    errors.append(e)
+            
+            for stage in stages:
+                stage.join()
+            if errors:
+                raise errors[0]
+            
+            # Every write must land before the video is marked completed
+            while pending_writes:
+                pending_writes.popleft().result()
             
             # Step 4: Update video status
             self.supabase.update_video_status(video_id, "completed")
@@ -133,14 +291,13 @@ class LokalPipeline:
                 "fps": processed_frames / processing_time if processing_time > 0 else 0
             }
             
-            print(f"🎉 Video processing completed!")
-            print(f"⏱️  Processing time: {processing_time:.2f}s")
-            print(f"📊 Results: {total_detections} detections, {total_matches} matches")
+            logger.info(f"🎉 Video processing completed in {processing_time:.2f}s: "
+                        f"{total_detections} detections, {total_matches} matches")
             
             return results
             
         except Exception as e:
-            print(f"❌ Error processing video: {e}")
+            logger.error(f"❌ Error processing video: {e}")
             
             # Update video status to failed
             if 'video_id' in locals():
@@ -151,6 +308,240 @@ class LokalPipeline:
                 "error": str(e),
                 "processing_time": time.time() - start_time
             }
+        
+        finally:
+            self._release_frame_slots()
+    
+    def _capture_stage(self, video_path: str, outbox: queue.Queue, errors: List[Exception]):
+        """
+        Pipeline stage: decode frames into the first queue, in batches of
+        DETECTION_BATCH_SIZE
+        
+        Args:
+            video_path: Path to video file
+            outbox: Queue receiving lists of (frame_num, frame)
+            errors: Shared list that stages append failures to
+        """
+        try:
+            for frame_batch in self.video_processor.extract_frames_batch(video_path, DETECTION_BATCH_SIZE):
+                if errors:
+                    break
+                outbox.put(list(zip(frame_batch.indices.tolist(), frame_batch.frames)))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            outbox.put(_STOP)
+    
+    def _run_stage(self, work, inbox: queue.Queue, outbox: queue.Queue, errors: List[Exception]):
+        """
+        Pipeline stage: apply `work` to every item from inbox
+        
+        After a failure anywhere the stage keeps draining its inbox without
+        working, so upstream stages never block on a full queue.
+        
+        Args:
+            work: Callable mapping one input item to one output item
+            inbox: Queue to read from
+            outbox: Queue to write to
+            errors: Shared list that stages append failures to
+        """
+        try:
+            while True:
+                item = inbox.get()
+                if item is _STOP:
+                    break
+                if errors:
+                    continue
+                try:
+                    outbox.put(work(item))
+                except Exception as e:
+                    errors.append(e)
+        finally:
+            outbox.put(_STOP)
+    
+    def _detect_batch(self, batch: List[Tuple]) -> List[Tuple]:
+        """
+        Pipeline stage work: run the detector on a batch of frames
+        
+        Low-motion frames reuse the last detected frame's detections, with a
+        periodic forced refresh so slow drift can't accumulate; the remaining
+        frames go through one batched detector call.
+        
+        Args:
+            batch: List of (frame_num, frame)
+            
+        Returns:
+            List of (frame_num, frame, detections)
+        """
+        to_detect = []
+        # Per frame: index into this batch's detector results, or None for
+        # detections carried over from an earlier batch
+        sources = []
+        source = None
+        
+        signatures = _frame_signatures([frame for _, frame in batch])
+        
+        for (frame_num, frame), signature in zip(batch, signatures):
+            logger.debug("🖼️  Processing frame %d...", frame_num + 1)
+            
+            if (self._last_signature is not None
+                    and self._frames_since_detection < DETECTION_REFRESH_INTERVAL
+                    and bin(signature ^ self._last_signature).count('1') < FRAME_HASH_DISTANCE):
+                self._frames_since_detection += 1
+            else:
+                to_detect.append(frame)
+                source = len(to_detect) - 1
+                self._last_signature = signature
+                self._frames_since_detection = 0
+            
+            sources.append(source)
+        
+        results = self.object_detector.detect_objects_batch_arrays(to_detect) if to_detect else []
+        results = [self._relevant(detections) for detections in results]
+        carried = self._last_detections
+        if results:
+            self._last_detections = results[-1]
+        
+        return [
+            (frame_num, frame, results[source] if source is not None else carried)
+            for (frame_num, frame), source in zip(batch, sources)
+        ]
+    
+    def _relevant(self, detections: Detections) -> Detections:
+        """
+        Keep only confident detections of allowed classes, as one array mask
+        
+        Args:
+            detections: Detections for a frame
+            
+        Returns:
+            Filtered Detections; empty ones skip crop, match and DB work
+        """
+        keep = detections.scores >= self.confidence_threshold
+        if self._allowed_class_ids is not None:
+            keep &= np.isin(detections.class_ids, self._allowed_class_ids)
+        
+        return detections if keep.all() else detections[keep]
+    
+    def _match_batch(self, batch: List[Tuple]) -> List[Tuple]:
+        """
+        Pipeline stage work: crop and match every detection in a batch of frames
+        
+        Args:
+            batch: List of (frame_num, frame, detections)
+            
+        Returns:
+            List of (frame_num, [(detection, match_result), ...])
+        """
+        if self.num_workers <= 1:
+            return [
+                (frame_num, _crop_and_match(self.cropper, self.matcher, frame, detections))
+                for frame_num, frame, detections in batch
+            ]
+        
+        if self._match_pool is None:
+            # spawn: workers must not inherit the parent's CUDA context
+            self._match_pool = ProcessPoolExecutor(
+                max_workers=self.num_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_match_worker
+            )
+        
+        # Frames without relevant detections are never sent to a worker
+        work = self._stage_frames([item for item in batch if len(item[2])])
+        if not work:
+            return [(frame_num, []) for frame_num, _, _ in batch]
+        
+        # Fan the frames out across the workers; map keeps frame order and
+        # returns only once every worker is done with the slots
+        chunk_size = -(-len(work) // self.num_workers)
+        chunks = [work[i:i + chunk_size] for i in range(0, len(work), chunk_size)]
+        matched = dict(item for chunk in self._match_pool.map(_crop_and_match_frames, chunks) for item in chunk)
+        
+        return [(frame_num, matched.get(frame_num, [])) for frame_num, _, _ in batch]
+    
+    def _stage_frames(self, work: List[Tuple]) -> List[Tuple]:
+        """
+        Copy frames into the shared-memory slots read by the match workers
+        
+        Slots are allocated on first use and only replaced when a frame
+        outgrows them, so a video's batches reuse the same few buffers
+        instead of pickling every frame through a pipe.
+        
+        Args:
+            work: List of (frame_num, frame, detections)
+            
+        Returns:
+            List of (frame_num, slot_name, shape, detections)
+        """
+        staged = []
+        for index, (frame_num, frame, detections) in enumerate(work):
+            if index == len(self._frame_slots):
+                self._frame_slots.append(shared_memory.SharedMemory(create=True, size=frame.nbytes))
+            elif self._frame_slots[index].size < frame.nbytes:
+                self._frame_slots[index].close()
+                self._frame_slots[index].unlink()
+                self._frame_slots[index] = shared_memory.SharedMemory(create=True, size=frame.nbytes)
+            
+            slot = self._frame_slots[index]
+            np.ndarray(frame.shape, dtype=np.uint8, buffer=slot.buf)[...] = frame
+            staged.append((frame_num, slot.name, frame.shape, detections))
+        
+        return staged
+    
+    def _release_frame_slots(self):
+        """Free the shared-memory frame slots once a video is done"""
+        for slot in self._frame_slots:
+            slot.close()
+            slot.unlink()
+        self._frame_slots = []
+    
+    def close(self):
+        """Shut down the worker pools and free the frame slots and cached video captures"""
+        if self._match_pool is not None:
+            self._match_pool.shutdown()
+            self._match_pool = None
+        self._db_writer.shutdown()
+        self._release_frame_slots()
+        self.video_processor.close()
+    
+    def __enter__(self) -> "LokalPipeline":
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def _save_match(self, video_id: str, detection: Dict, match_result: Dict) -> Tuple[str, str, str]:
+        """
+        Save a matched detection, its crop and its product to the database
+        
+        Args:
+            video_id: Video ID for database records
+            detection: Detection dictionary with its BGR crop
+            match_result: Successful match result
+            
+        Returns:
+            (detection_id, product_id, crop_url)
+        """
+        # Save detection to database
+        detection_id = self.supabase.save_detection(
+            video_id=video_id,
+            label=detection["class_name"],
+            bbox=detection["bbox"]
+        )
+        
+        # Upload crop image
+        pil_crop = self.cropper.crop_to_pil(detection["crop"])
+        crop_url = self.supabase.upload_crop_image(pil_crop, detection_id)
+        
+        # Save matched product
+        product_id = self.supabase.save_matched_product(
+            object_id=detection_id,
+            label=match_result["product_name"],
+            match_type="auto"
+        )
+        
+        return detection_id, product_id, crop_url
     
     def process_frame(self, frame, video_id: str) -> List[Dict]:
         """
@@ -166,44 +557,20 @@ class LokalPipeline:
         results = []
         
         # Detect objects
-        detections = self.object_detector.detect_objects(frame)
+        detections = self._relevant(self.object_detector.detect_objects_batch_arrays([frame])[0])
         
-        if detections:
-            # Crop detected objects
-            cropped_detections = self.cropper.crop_detections(frame, detections)
-            
-            for detection in cropped_detections:
-                # Convert crop to PIL Image
-                pil_crop = self.cropper.crop_to_pil(detection["crop"])
-                
-                # Match product
-                match_result = self.matcher.match_product(pil_crop)
+        for detection, match_result in _crop_and_match(self.cropper, self.matcher, frame, detections):
+            if match_result.get("success", False):
+                # Save to database
+                detection_id, product_id, crop_url = self._save_match(video_id, detection, match_result)
                 
-                if match_result.get("success", False):
-                    # Save to database
-                    detection_id = self.supabase.save_detection(
-                        video_id=video_id,
-                        label=detection["class_name"],
-                        bbox=detection["bbox"]
-                    )
-                    
-                    # Upload crop
-                    crop_url = self.supabase.upload_crop_image(pil_crop, detection_id)
-                    
-                    # Save match
-                    product_id = self.supabase.save_matched_product(
-                        object_id=detection_id,
-                        label=match_result["product_name"],
-                        match_type="auto"
-                    )
-                    
-                    results.append({
-                        "detection": detection,
-                        "match": match_result,
-                        "detection_id": detection_id,
-                        "product_id": product_id,
-                        "crop_url": crop_url
-                    })
+                results.append({
+                    "detection": detection,
+                    "match": match_result,
+                    "detection_id": detection_id,
+                    "product_id": product_id,
+                    "crop_url": crop_url
+                })
         
         return results
     
@@ -228,11 +595,14 @@ class LokalPipeline:
             # Get detections
             detections = self.supabase.get_detected_objects(video_id)
             
-            # Get matches
+            # Get matches; the per-detection lookups are independent, so fan
+            # them out over threads instead of paying each round-trip in turn.
+            # A pool of its own, so stats still work after close()
             matches = []
-            for detection in detections:
-                detection_matches = self.supabase.get_matched_products(detection["id"])
-                matches.extend(detection_matches)
+            detection_ids = [detection["id"] for detection in detections]
+            with ThreadPoolExecutor(max_workers=DB_WRITER_THREADS, thread_name_prefix="db-stats") as lookups:
+                for detection_matches in lookups.map(self.supabase.get_matched_products, detection_ids):
+                    matches.extend(detection_matches)
             
             return {
                 "video_info": video_info,
@@ -257,30 +627,30 @@ class LokalPipeline:
         try:
             if os.path.exists(temp_dir):
                 shutil.rmtree(temp_dir)
-                print(f"🧹 Cleaned up temporary directory: {temp_dir}")
+                logger.info(f"🧹 Cleaned up temporary directory: {temp_dir}")
         except Exception as e:
-            print(f"Error cleaning up temp files: {e}")
+            logger.error(f"Error cleaning up temp files: {e}")
 
 
 def main():
     """Example usage of the Lokal Pipeline"""
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper(), format='%(message)s')
     
-    # Initialize pipeline
-    pipeline = LokalPipeline(
+    # Initialize pipeline; leaving the block stops its worker pools
+    with LokalPipeline(
         frame_rate=30,
         confidence_threshold=0.5,
         model_path="yolov8n.pt"
-    )
-    
-    # Example video processing
-    video_path = "path/to/your/video.mp4"
-    user_id = "example-user-id"
-    
-    if os.path.exists(video_path):
-        results = pipeline.process_video(video_path, user_id)
-        print(f"Processing results: {results}")
-    else:
-        print(f"Video file not found: {video_path}")
+    ) as pipeline:
+        # Example video processing
+        video_path = "path/to/your/video.mp4"
+        user_id = "example-user-id"
+        
+        if os.path.exists(video_path):
+            results = pipeline.process_video(video_path, user_id)
+            print(f"Processing results: {results}")
+        else:
+            print(f"Video file not found: {video_path}")
 
 
 if __name__ == "__main__":
@@ -8,18 +8,22 @@ import os
 import sys
 import subprocess
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 
 def run_command(command, description):
-    """Run a command and handle errors"""
+    """Run a command (argument list, no shell) and handle errors"""
     print(f"🔄 {description}...")
     try:
-        result = subprocess.run(command, shell=True, check=True, capture_output=True, text=True)
+        result = subprocess.run(command, check=True, capture_output=True, text=True)
         print(f"✅ {description} completed")
         return True
     except subprocess.CalledProcessError as e:
         print(f"❌ {description} failed: {e}")
         print(f"Error output: {e.stderr}")
         return False
+    except FileNotFoundError as e:
+        print(f"❌ {description} failed: {e}")
+        return False
 
 def check_python_version():
     """Check if Python version is compatible"""
@@ -43,7 +47,7 @@ def install_dependencies():
         return False
     
     # Install requirements
-    if not run_command("pip3 install -r requirements.txt", "Installing Python packages"):
+    if not run_command(["pip3", "install", "--prefer-binary", "-r", "requirements.txt"], "Installing Python packages"):
         return False
     
     return True
@@ -60,7 +64,7 @@ def download_yolo_model():
     print("📥 Downloading YOLO model...")
     download_url = "https://github.com/ultralytics/assets/releases/download/v0.0.0/yolov8n.pt"
     
-    if not run_command(f"curl -L -o {model_path} {download_url}", "Downloading YOLO model"):
+    if not run_command(["curl", "-L", "-o", model_path, download_url], "Downloading YOLO model"):
         return False
     
     return True
@@ -106,7 +110,7 @@ def run_tests():
     """Run basic tests"""
     print("🧪 Running tests...")
     
-    if not run_command("python3 test_engine.py", "Running engine tests"):
+    if not run_command(["python3", "test_engine.py"], "Running engine tests"):
         print("⚠️  Tests failed, but setup can continue")
         return True  # Don't fail setup if tests fail
     
@@ -116,24 +120,29 @@ def main():
     """Main setup function"""
     print("🚀 Setting up Lokal Engine...\n")
     
-    steps = [
-        ("Python Version Check", check_python_version),
-        ("Create Directories", create_directories),
-        ("Setup Environment", setup_environment),
-        ("Install Dependencies", install_dependencies),
-        ("Download YOLO Model", download_yolo_model),
-        ("Run Tests", run_tests),
+    # Steps in the same group are independent and run concurrently; the
+    # package install and model download are both network-bound
+    step_groups = [
+        [("Python Version Check", check_python_version)],
+        [("Create Directories", create_directories)],
+        [("Setup Environment", setup_environment)],
+        [("Install Dependencies", install_dependencies), ("Download YOLO Model", download_yolo_model)],
+        [("Run Tests", run_tests)],
     ]
     
     failed_steps = []
     
-    for step_name, step_func in steps:
+    for group in step_groups:
         print(f"\n{'='*50}")
-        print(f"Step: {step_name}")
+        print(f"Step: {' + '.join(step_name for step_name, _ in group)}")
         print('='*50)
         
-        if not step_func():
-            failed_steps.append(step_name)
+        with ThreadPoolExecutor(max_workers=len(group)) as executor:
+            futures = [(step_name, executor.submit(step_func)) for step_name, step_func in group]
+        
+        for step_name, future in futures:
+            if not future.result():
+                failed_steps.append(step_name)
     
     print(f"\n{'='*50}")
     print("Setup Complete!")
@@ -3,59 +3,617 @@ Video processor for Lokal Engine
 Uses OpenCV to extract frames from videos
 """
 
+import atexit
+import functools
 import cv2
 import os
-from typing import Generator, Tuple, Optional
+import queue
+import threading
+import multiprocessing
+from collections import OrderedDict
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Generator, List, Literal, Tuple, Optional
 import numpy as np
 from PIL import Image
 
+# Resizing and converting frames that are already on the GPU
+try:
+    import torch
+    import torch.nn.functional as F
+    TORCH_AVAILABLE = True
+except ImportError:
+    TORCH_AVAILABLE = False
+
+# NVDEC decoding straight into CUDA tensors
+try:
+    from torchcodec.decoders import VideoDecoder
+    TORCHCODEC_AVAILABLE = True
+except ImportError:
+    TORCHCODEC_AVAILABLE = False
+
+# FFmpeg decoding with per-stream codec threads
+try:
+    import av
+    AV_AVAILABLE = True
+except ImportError:
+    AV_AVAILABLE = False
+
+# Strides of at least this many frames (x264's default keyframe interval)
+# seek straight to the next wanted frame instead of grabbing every frame
+# in between; shorter strides would re-decode from the same keyframe
+SEEK_FRAME_STRIDE = 250
+
+# Idle captures kept open so get_video_info followed by extract_frames on
+# the same file pays for demuxer setup once
+MAX_CACHED_CAPTURES = 4
+
+# Threads encoding and writing frames in save_frames; OpenCV releases the
+# GIL while encoding
+SAVE_WORKERS = 4
+
+# Frames save_frame_async lets wait for the background writer before it blocks
+WRITE_QUEUE_SIZE = 64
+
+def _is_tensor(frame) -> bool:
+    """Whether a frame is a torch tensor rather than an OpenCV array"""
+    return TORCH_AVAILABLE and isinstance(frame, torch.Tensor)
+
+def _tensor_to_rgb(frame_tensor) -> np.ndarray:
+    """Quantize a float (3, H, W) RGB tensor on its device, then copy it to the host as HxWx3 uint8"""
+    return frame_tensor.mul(255).round_().clamp_(0, 255).to(torch.uint8).permute(1, 2, 0).cpu().numpy()
+
+@dataclass
+class FrameBatch:
+    """
+    A batch of extracted frames with their metadata as arrays
+    
+    The frames can go to a detector in one batched call, and timestamps
+    are computed for the whole batch at once.
+    """
+    indices: np.ndarray     # (N,) int64 extracted frame numbers
+    frames: List[np.ndarray]  # N BGR frames
+    timestamps: np.ndarray  # (N,) float64 seconds into the video
+    
+    def __len__(self) -> int:
+        return len(self.frames)
+
+@functools.lru_cache(maxsize=64)
+def _fit_size(width: int, height: int, max_width: int, max_height: int) -> Optional[Tuple[int, int]]:
+    """
+    Size that fits (width, height) within the maximums, keeping aspect ratio
+    
+    Cached, since a video only ever has a handful of frame sizes.
+    
+    Returns:
+        (new_width, new_height), or None if the size already fits
+    """
+    if width <= max_width and height <= max_height:
+        return None
+    
+    # Scale to whichever side is the tighter fit, in integer arithmetic so
+    # the fitted side lands exactly on its maximum
+    if max_width * height <= max_height * width:
+        return max_width, height * max_width // width
+    return width * max_height // height, max_height
+
+def _extract_to_dir(settings: dict, index: int, video_path: str, output_dir: str) -> List[str]:
+    """
+    Extract a video's frames to JPEG files in a worker process
+    
+    Args:
+        settings: VideoProcessor keyword arguments
+        index: Position of the video in the input list, which prefixes its
+            frame names so videos with the same file name don't collide
+        video_path: Path to video file
+        output_dir: Directory for the frames
+        
+    Returns:
+        Paths of the saved frames, in frame order
+    """
+    # Workers already run side by side, one per core pair
+    VideoProcessor.configure_threads('per-frame')
+    processor = VideoProcessor(**settings)
+    frames = processor.extract_frames_av(video_path) if AV_AVAILABLE else processor.extract_frames(video_path)
+    prefix = f"{index:04d}_{os.path.splitext(os.path.basename(video_path))[0]}"
+    
+    saved = []
+    try:
+        for frame_number, frame in frames:
+            output_path = os.path.join(output_dir, f"{prefix}_{frame_number:06d}.jpg")
+            processor.save_frame_async(frame, output_path)
+            saved.append(output_path)
+        
+        if not processor.flush():
+            raise RuntimeError(f"Could not save every frame of {video_path}")
+    finally:
+        processor.close()
+    
+    return saved
+
 class VideoProcessor:
-    def __init__(self, frame_rate: int = 30):
+    def __init__(self, frame_rate: int = 30, max_size: Optional[int] = None, hw_decode: bool = True,
+                 frame_buffers: int = 0, encode_params: Optional[List[int]] = None, sync_writes: bool = False):
         """
         Initialize video processor
         
         Args:
             frame_rate: Number of frames to skip between extractions
+            max_size: If set, extracted frames whose longer side exceeds this
+                are downscaled to it (aspect ratio kept) before being yielded
+            hw_decode: Decode with the FFmpeg backend's hardware acceleration
+                (NVDEC, VAAPI, D3D11, ...) where OpenCV and the host support it
+            frame_buffers: If set, extract_frames decodes into a ring of this
+                many preallocated arrays instead of a new array per frame. A
+                yielded frame is then only valid until frame_buffers more
+                frames have been yielded, so it must exceed the number of
+                frames the consumer holds at once
+            encode_params: cv2.imencode parameters for saved frames, e.g.
+                [cv2.IMWRITE_JPEG_QUALITY, 85] or [cv2.IMWRITE_PNG_COMPRESSION, 1]
+            sync_writes: Open saved frames with O_DSYNC so each write reaches
+                the disk before returning, trading throughput for steady
+                latency instead of bursty page-cache writeback
         """
         self.frame_rate = frame_rate
+        self.max_size = max_size
+        self.hw_decode = hw_decode
+        self.frame_buffers = frame_buffers
+        self.encode_params = encode_params or []
+        self.sync_writes = sync_writes
+        
+        # Flags for opening saved frames; O_DSYNC only exists on POSIX
+        self._write_flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0)
+        if sync_writes:
+            self._write_flags |= getattr(os, 'O_DSYNC', 0)
+        
+        # Idle captures by (path, mtime, size), least recently used first.
+        # A capture is taken out while in use, so it is never shared between
+        # concurrent callers
+        self._cap_cache = OrderedDict()
+        self._cap_lock = threading.Lock()
         
-    def extract_frames(self, video_path: str) -> Generator[Tuple[int, np.ndarray], None, None]:
+        # Background writer for save_frame_async, started on first use and
+        # stopped by close()
+        self._write_queue = None
+        self._writer_thread = None
+        self._write_failures = 0
+        self._writer_lock = threading.Lock()
+        
+    @staticmethod
+    def configure_threads(mode: Literal['per-frame', 'per-pipeline']):
+        """
+        Set how many threads OpenCV uses inside each resize, color conversion or encode
+        
+        This is process-wide. Use 'per-frame' when the caller already works
+        on several frames at once (extract_frames_threaded with concurrent
+        consumers, save_frames, worker pools): OpenCV then stays on the
+        calling thread, since its own threads on top would oversubscribe the
+        cores. Use 'per-pipeline' when frames are processed one at a time,
+        so each OpenCV call can use every core.
+        
+        Args:
+            mode: 'per-frame' or 'per-pipeline'
+        """
+        if mode == 'per-frame':
+            cv2.setNumThreads(1)
+        elif mode == 'per-pipeline':
+            cv2.setNumThreads(os.cpu_count() or 1)
+        else:
+            raise ValueError(f"Unknown threading mode: {mode}")
+    
+    def extract_frames(self, video_path: str, max_frames: Optional[int] = None) -> Generator[Tuple[int, np.ndarray], None, None]:
         """
         Extract frames from video at specified frame rate
         
         Args:
             video_path: Path to video file
+            max_frames: If set, stop after extracting this many frames,
+                without decoding the rest of the video
             
         Yields:
-            Tuple of (frame_number, frame_array)
+            Tuple of (frame_number, frame_array); with frame_buffers set the
+            array is reused, see __init__
         """
         if not os.path.exists(video_path):
             raise FileNotFoundError(f"Video file not found: {video_path}")
         
-        cap = cv2.VideoCapture(video_path)
+        if max_frames == 0:
+            return
         
-        if not cap.isOpened():
-            raise ValueError(f"Could not open video file: {video_path}")
+        key, cap = self._acquire_capture(video_path)
         
         try:
             frame_count = 0
             extracted_count = 0
+            # Index of the next frame to keep; one comparison per frame
+            # instead of a modulo
+            next_target = 0
+            seek = self.frame_rate >= SEEK_FRAME_STRIDE
+            ring = []
             
-            while True:
-                ret, frame = cap.read()
-                if not ret:
-                    break
-                
+            # grab() only advances the stream; the BGR conversion and copy in
+            # retrieve() are paid just for the frames that are kept
+            while cap.grab():
                 # Extract every nth frame based on frame_rate
-                if frame_count % self.frame_rate == 0:
+                if frame_count == next_target:
+                    next_target += self.frame_rate
+                    if not self.frame_buffers:
+                        ret, frame = cap.retrieve()
+                    elif len(ring) < self.frame_buffers:
+                        ret, frame = cap.retrieve()
+                        ring.append(frame)
+                    else:
+                        # OpenCV decodes into the passed array when its shape
+                        # and type match, and reallocates otherwise
+                        slot = extracted_count % self.frame_buffers
+                        ret, frame = cap.retrieve(ring[slot])
+                        ring[slot] = frame
+                    if not ret:
+                        break
+                    
+                    if self.max_size is not None:
+                        frame = self._downscale(frame)
+                    
                     yield extracted_count, frame
                     extracted_count += 1
+                    if extracted_count == max_frames:
+                        break
+                    
+                    if seek:
+                        # Unseekable streams fall back to grabbing through
+                        if cap.set(cv2.CAP_PROP_POS_FRAMES, frame_count + self.frame_rate):
+                            frame_count += self.frame_rate
+                            continue
+                        seek = False
                 
                 frame_count += 1
                 
         finally:
+            self._release_capture(key, cap)
+    
+    def extract_frames_batch(self, video_path: str, batch_size: int = 32) -> Generator[FrameBatch, None, None]:
+        """
+        Extract frames like extract_frames, grouped into batches
+        
+        Args:
+            video_path: Path to video file
+            batch_size: Frames per batch; the last batch may be shorter
+            
+        Yields:
+            FrameBatch of up to batch_size consecutive extracted frames
+        """
+        fps = self.get_video_info(video_path)["fps"]
+        seconds_per_index = self.frame_rate / fps if fps > 0 else 0.0
+        
+        def make_batch(start: int, frames: List[np.ndarray]) -> FrameBatch:
+            indices = np.arange(start, start + len(frames), dtype=np.int64)
+            return FrameBatch(indices, frames, indices * seconds_per_index)
+        
+        start = 0
+        frames = []
+        for _, frame in self.extract_frames(video_path):
+            frames.append(frame)
+            if len(frames) == batch_size:
+                yield make_batch(start, frames)
+                start += len(frames)
+                frames = []
+        
+        # Tail flush: the last, possibly short, batch
+        if frames:
+            yield make_batch(start, frames)
+    
+    def extract_frames_by_time(self, video_path: str, interval_seconds: float) -> Generator[Tuple[int, np.ndarray], None, None]:
+        """
+        Extract one frame per interval of video time
+        
+        Unlike extract_frames' frame-count stride, this follows timestamps, so
+        variable frame rate videos are sampled evenly. Intervals spanning at
+        least SEEK_FRAME_STRIDE frames seek to the next sample; on streams
+        without usable timestamps the seek can land on a nearby keyframe.
+        
+        Args:
+            video_path: Path to video file
+            interval_seconds: Video time between extracted frames
+            
+        Yields:
+            Tuple of (frame_number, frame_array)
+        """
+        if not os.path.exists(video_path):
+            raise FileNotFoundError(f"Video file not found: {video_path}")
+        
+        key, cap = self._acquire_capture(video_path)
+        
+        try:
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            interval_ms = interval_seconds * 1000
+            # A frame within half a frame of the target counts as on time
+            tolerance_ms = 500 / fps if fps > 0 else 0
+            seek = fps > 0 and interval_seconds * fps >= SEEK_FRAME_STRIDE
+            target_ms = 0.0
+            extracted_count = 0
+            
+            while cap.grab():
+                if cap.get(cv2.CAP_PROP_POS_MSEC) < target_ms - tolerance_ms:
+                    continue
+                
+                ret, frame = cap.retrieve()
+                if not ret:
+                    break
+                
+                if self.max_size is not None:
+                    frame = self._downscale(frame)
+                
+                yield extracted_count, frame
+                extracted_count += 1
+                target_ms = extracted_count * interval_ms
+                
+                # Unseekable streams fall back to grabbing through
+                if seek and not cap.set(cv2.CAP_PROP_POS_MSEC, target_ms):
+                    seek = False
+                
+        finally:
+            self._release_capture(key, cap)
+    
+    def extract_frames_av(self, video_path: str) -> Generator[Tuple[int, np.ndarray], None, None]:
+        """
+        Extract frames like extract_frames, decoding with PyAV
+        
+        FFmpeg decodes the stream with its own frame and slice threads, and
+        only kept frames are converted to BGR arrays.
+        
+        Args:
+            video_path: Path to video file
+            
+        Yields:
+            Tuple of (frame_number, frame_array)
+        """
+        if not AV_AVAILABLE:
+            raise RuntimeError("PyAV is required for PyAV frame extraction")
+        
+        if not os.path.exists(video_path):
+            raise FileNotFoundError(f"Video file not found: {video_path}")
+        
+        with av.open(video_path) as container:
+            stream = container.streams.video[0]
+            stream.thread_type = 'AUTO'
+            
+            extracted_count = 0
+            # Every frame is still decoded, as later frames reference it
+            for frame_count, av_frame in enumerate(container.decode(stream)):
+                if frame_count % self.frame_rate:
+                    continue
+                
+                frame = av_frame.to_ndarray(format='bgr24')
+                if self.max_size is not None:
+                    frame = self._downscale(frame)
+                
+                yield extracted_count, frame
+                extracted_count += 1
+    
+    def extract_many(self, video_paths: List[str], output_dir: str, workers: Optional[int] = None) -> Dict[str, List[str]]:
+        """
+        Extract frames from many videos in parallel worker processes
+        
+        Each worker decodes one video at a time (with PyAV when installed)
+        and saves its frames as JPEGs itself, so only file paths come back.
+        
+        Args:
+            video_paths: Paths to video files
+            output_dir: Directory for the frames, named <index>_<video>_<frame>.jpg
+                where index is the video's position in video_paths
+            workers: Worker processes; defaults to half the CPU count, since
+                each decoder runs threads of its own
+            
+        Returns:
+            Dictionary mapping each video path to its saved frame paths
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        workers = workers or max(1, (os.cpu_count() or 2) // 2)
+        settings = {
+            "frame_rate": self.frame_rate,
+            "max_size": self.max_size,
+            "hw_decode": self.hw_decode,
+            "encode_params": self.encode_params,
+            "sync_writes": self.sync_writes,
+        }
+        
+        # spawn: workers must not inherit the parent's CUDA context
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = [
+                pool.submit(_extract_to_dir, settings, index, video_path, output_dir)
+                for index, video_path in enumerate(video_paths)
+            ]
+            return {video_path: future.result() for video_path, future in zip(video_paths, futures)}
+    
+    def _open_capture(self, video_path: str) -> cv2.VideoCapture:
+        """
+        Open a capture for decoding, hardware-accelerated when possible
+        
+        Args:
+            video_path: Path to video file
+            
+        Returns:
+            VideoCapture on the FFmpeg backend with hardware decoding
+            requested, or on the default backend if that can't be opened
+        """
+        # OpenCV < 4.5.2 has no hardware acceleration properties
+        if self.hw_decode and hasattr(cv2, 'CAP_PROP_HW_ACCELERATION'):
+            # ANY picks the first available accelerator and otherwise decodes in software
+            cap = cv2.VideoCapture(
+                video_path, cv2.CAP_FFMPEG,
+                [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+            )
+            if cap.isOpened():
+                return cap
+            cap.release()
+        
+        return cv2.VideoCapture(video_path)
+    
+    def _acquire_capture(self, video_path: str) -> Tuple[tuple, cv2.VideoCapture]:
+        """
+        Take an idle capture for a file out of the cache, or open a new one
+        
+        Args:
+            video_path: Path to video file
+            
+        Returns:
+            Tuple of (cache key, capture positioned at the first frame)
+        """
+        stat = os.stat(video_path)
+        key = (video_path, stat.st_mtime_ns, stat.st_size)
+        
+        with self._cap_lock:
+            cap = self._cap_cache.pop(key, None)
+        
+        # A capture left mid-stream by an earlier extraction is rewound; if
+        # the stream can't seek, reopen it instead
+        if cap is not None and cap.get(cv2.CAP_PROP_POS_FRAMES) != 0 and not cap.set(cv2.CAP_PROP_POS_FRAMES, 0):
+            cap.release()
+            cap = None
+        
+        if cap is None:
+            cap = self._open_capture(video_path)
+            if not cap.isOpened():
+                raise ValueError(f"Could not open video file: {video_path}")
+        
+        return key, cap
+    
+    def _release_capture(self, key: tuple, cap: cv2.VideoCapture):
+        """
+        Return a capture to the idle cache, closing the least recently used ones beyond MAX_CACHED_CAPTURES
+        
+        Args:
+            key: Cache key from _acquire_capture
+            cap: Capture to return
+        """
+        evicted = []
+        with self._cap_lock:
+            # Another caller may have returned a capture for the same file meanwhile
+            previous = self._cap_cache.pop(key, None)
+            if previous is not None:
+                evicted.append(previous)
+            self._cap_cache[key] = cap
+            while len(self._cap_cache) > MAX_CACHED_CAPTURES:
+                evicted.append(self._cap_cache.popitem(last=False)[1])
+        
+        for stale in evicted:
+            stale.release()
+    
+    def close(self):
+        """Finish queued frame writes, stop the writer thread and release every cached capture"""
+        with self._writer_lock:
+            write_queue, writer_thread = self._write_queue, self._writer_thread
+            self._write_queue = self._writer_thread = None
+        
+        if write_queue is not None:
+            # The sentinel queues behind any pending frames, so they are still written
+            write_queue.put(None)
+            writer_thread.join()
+            atexit.unregister(self.flush)
+        
+        with self._cap_lock:
+            captures = list(self._cap_cache.values())
+            self._cap_cache.clear()
+        
+        for cap in captures:
             cap.release()
     
+    def extract_frames_threaded(self, video_path: str, queue_size: int = 8) -> Generator[Tuple[int, np.ndarray], None, None]:
+        """
+        Extract frames like extract_frames, decoding ahead on a background thread
+        
+        OpenCV releases the GIL while decoding, so decode overlaps with
+        whatever the caller does with each frame. At most queue_size decoded
+        frames wait in memory.
+        
+        Args:
+            video_path: Path to video file
+            queue_size: Decoded frames allowed to wait for the caller
+            
+        Yields:
+            Tuple of (frame_number, frame_array)
+        """
+        frames = queue.Queue(maxsize=queue_size)
+        stop = threading.Event()
+        errors = []
+        
+        def put(item) -> bool:
+            # Time out periodically so a caller that stops early frees the thread
+            while not stop.is_set():
+                try:
+                    frames.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+        
+        def produce():
+            try:
+                for item in self.extract_frames(video_path):
+                    if not put(item):
+                        return
+            except Exception as e:
+                errors.append(e)
+            put(None)
+        
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        
+        try:
+            while True:
+                item = frames.get()
+                if item is None:
+                    break
+                yield item
+            
+            if errors:
+                raise errors[0]
+        finally:
+            stop.set()
+            producer.join()
+    
+    def _downscale(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Shrink a frame so its longer side is at most max_size
+        
+        Args:
+            frame: Input frame
+            
+        Returns:
+            Downscaled frame, or the frame itself if already small enough
+        """
+        height, width = frame.shape[:2]
+        scale = self.max_size / max(height, width)
+        
+        if scale >= 1:
+            return frame
+        
+        # INTER_AREA averages source pixels, so shrinking doesn't alias
+        return cv2.resize(frame, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+    
+    def extract_frames_cuda(self, video_path: str) -> Generator[Tuple[int, "torch.Tensor"], None, None]:
+        """
+        Extract frames at the specified frame rate with NVDEC, keeping them on the GPU
+        
+        Args:
+            video_path: Path to video file
+            
+        Yields:
+            Tuple of (frame_number, frame_tensor) where frame_tensor is an RGB
+            float (3, H, W) CUDA tensor in [0, 1], the layout ObjectDetector.upload_frame returns
+        """
+        if not TORCHCODEC_AVAILABLE:
+            raise RuntimeError("torchcodec is required for CUDA frame extraction")
+        
+        if not os.path.exists(video_path):
+            raise FileNotFoundError(f"Video file not found: {video_path}")
+        
+        decoder = VideoDecoder(video_path, device='cuda')
+        
+        for extracted_count, index in enumerate(range(0, len(decoder), self.frame_rate)):
+            # Decoded frames are uint8 (3, H, W) RGB, already in device memory
+            yield extracted_count, decoder[index].float().div_(255)
+    
     def get_video_info(self, video_path: str) -> dict:
         """
         Get video metadata
@@ -69,10 +627,7 @@ class VideoProcessor:
         if not os.path.exists(video_path):
             raise FileNotFoundError(f"Video file not found: {video_path}")
         
-        cap = cv2.VideoCapture(video_path)
-        
-        if not cap.isOpened():
-            raise ValueError(f"Could not open video file: {video_path}")
+        key, cap = self._acquire_capture(video_path)
         
         try:
             # Get video properties
@@ -91,47 +646,95 @@ class VideoProcessor:
                 "extracted_frames": frame_count // self.frame_rate if self.frame_rate > 0 else frame_count
             }
         finally:
-            cap.release()
+            self._release_capture(key, cap)
     
     def resize_frame(self, frame: np.ndarray, max_width: int = 1920, max_height: int = 1080) -> np.ndarray:
         """
         Resize frame to fit within specified dimensions while maintaining aspect ratio
         
         Args:
-            frame: Input frame
+            frame: Input frame, or a (3, H, W) tensor from extract_frames_cuda,
+                which is resized on its own device
             max_width: Maximum width
             max_height: Maximum height
             
         Returns:
             Resized frame
         """
-        height, width = frame.shape[:2]
-        
-        # Calculate scaling factor
-        scale = min(max_width / width, max_height / height)
+        if _is_tensor(frame):
+            height, width = frame.shape[1:]
+        else:
+            height, width = frame.shape[:2]
         
-        if scale < 1:
-            new_width = int(width * scale)
-            new_height = int(height * scale)
-            frame = cv2.resize(frame, (new_width, new_height))
+        target = _fit_size(width, height, max_width, max_height)
+        if target is not None:
+            new_width, new_height = target
+            if _is_tensor(frame):
+                frame = F.interpolate(
+                    frame[None], size=(new_height, new_width), mode='bilinear',
+                    align_corners=False, antialias=True
+                )[0]
+            else:
+                # INTER_AREA averages source pixels, so shrinking doesn't alias
+                frame = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_AREA)
         
         return frame
     
+    def frame_to_rgb_array(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Convert OpenCV frame to an RGB array without copying
+        
+        For consumers that take numpy input directly; prefer this over
+        frame_to_pil when a PIL Image isn't needed.
+        
+        Args:
+            frame: OpenCV frame (BGR format)
+            
+        Returns:
+            RGB view of frame; it aliases frame, so copy it if the frame's
+            buffer is reused (VideoProcessor(frame_buffers=...))
+        """
+        return frame[..., ::-1]
+    
+    def frame_to_tensor(self, frame: np.ndarray, device: str = 'cpu') -> "torch.Tensor":
+        """
+        Convert OpenCV frame to the tensor layout extract_frames_cuda yields
+        
+        The BGR frame is wrapped without a copy and moved as uint8; the
+        channel swap and float conversion then run on the target device.
+        
+        Args:
+            frame: OpenCV frame (BGR format)
+            device: Device for the tensor
+            
+        Returns:
+            RGB float (3, H, W) tensor in [0, 1]
+        """
+        if not TORCH_AVAILABLE:
+            raise RuntimeError("torch is required for tensor conversion")
+        
+        tensor = torch.from_numpy(np.ascontiguousarray(frame)).to(device)
+        return tensor.permute(2, 0, 1).flip(0).float().div_(255)
+    
     def frame_to_pil(self, frame: np.ndarray) -> Image.Image:
         """
         Convert OpenCV frame to PIL Image
         
         Args:
-            frame: OpenCV frame (BGR format)
+            frame: OpenCV frame (BGR format), or a (3, H, W) tensor from
+                extract_frames_cuda, which is only copied to the host here
             
         Returns:
             PIL Image (RGB format)
         """
-        # Convert BGR to RGB
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        if _is_tensor(frame):
+            return Image.fromarray(_tensor_to_rgb(frame))
         
-        # Convert to PIL Image
-        pil_image = Image.fromarray(rgb_frame)
+        # PIL copies RGB data into its own storage anyway; its BGR raw
+        # unpacker swaps the channels during that copy, so no intermediate
+        # RGB array is allocated
+        height, width = frame.shape[:2]
+        pil_image = Image.frombuffer('RGB', (width, height), np.ascontiguousarray(frame), 'raw', 'BGR', 0, 1)
         
         return pil_image
     
@@ -140,7 +743,7 @@ class VideoProcessor:
         Save frame to file
         
         Args:
-            frame: Frame to save
+            frame: Frame to save (BGR), or a (3, H, W) tensor from extract_frames_cuda
             output_path: Output file path
             
         Returns:
@@ -148,11 +751,135 @@ class VideoProcessor:
         """
         try:
             # Ensure output directory exists
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            directory = os.path.dirname(output_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        except Exception as e:
+            print(f"Error saving frame: {e}")
+            return False
+        
+        return self._write_frame(frame, output_path)
+    
+    def save_frames(self, frames: List[Tuple[np.ndarray, str]]) -> List[bool]:
+        """
+        Save many frames, creating each output directory once and encoding in parallel
+        
+        Args:
+            frames: List of (frame, output_path); frames as accepted by save_frame
+            
+        Returns:
+            Per-frame success flags, in input order
+        """
+        try:
+            for directory in {os.path.dirname(output_path) for _, output_path in frames}:
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+        except Exception as e:
+            print(f"Error saving frames: {e}")
+            return [False] * len(frames)
+        
+        with ThreadPoolExecutor(max_workers=SAVE_WORKERS) as executor:
+            return list(executor.map(lambda item: self._write_frame(*item), frames))
+    
+    def save_frame_async(self, frame: np.ndarray, output_path: str):
+        """
+        Queue a frame to be saved by a background writer thread
+        
+        Encoding and disk IO overlap with the caller's next frame. At most
+        WRITE_QUEUE_SIZE frames wait; beyond that this blocks. Call flush()
+        to wait for the writes and find out whether they succeeded.
+        
+        Args:
+            frame: Frame to save, as accepted by save_frame; it is copied, so
+                the caller may reuse its buffer
+            output_path: Output file path
+        """
+        with self._writer_lock:
+            if self._write_queue is None:
+                self._write_queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+                self._writer_thread = threading.Thread(
+                    target=self._writer_loop, args=(self._write_queue,), daemon=True
+                )
+                self._writer_thread.start()
+                # Queued frames still land if the process exits without a flush
+                atexit.register(self.flush)
+            write_queue = self._write_queue
+        
+        write_queue.put((frame.clone() if _is_tensor(frame) else frame.copy(), output_path))
+    
+    def flush(self) -> bool:
+        """
+        Wait until every frame queued by save_frame_async is written
+        
+        Returns:
+            True if all writes since the last flush succeeded, False otherwise
+        """
+        write_queue = self._write_queue
+        if write_queue is not None:
+            write_queue.join()
+        
+        with self._writer_lock:
+            failures, self._write_failures = self._write_failures, 0
+        
+        return failures == 0
+    
+    def _writer_loop(self, write_queue: queue.Queue):
+        """
+        Background writer: save queued frames until close() queues the None sentinel
+        
+        Args:
+            write_queue: Queue of (frame, output_path) this thread drains
+        """
+        while True:
+            item = write_queue.get()
+            if item is None:
+                write_queue.task_done()
+                return
+            
+            frame, output_path = item
+            try:
+                directory = os.path.dirname(output_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                success = self._write_frame(frame, output_path)
+            except Exception as e:
+                print(f"Error saving frame: {e}")
+                success = False
+            
+            if not success:
+                with self._writer_lock:
+                    self._write_failures += 1
+            write_queue.task_done()
+    
+    def _write_frame(self, frame: np.ndarray, output_path: str) -> bool:
+        """
+        Encode a frame by its file extension and write it, without creating directories
+        
+        Args:
+            frame: Frame to save (BGR), or a (3, H, W) tensor from extract_frames_cuda
+            output_path: Output file path
+            
+        Returns:
+            True if successful, False otherwise
+        """
+        if _is_tensor(frame):
+            frame = np.ascontiguousarray(_tensor_to_rgb(frame)[..., ::-1])
+        
+        try:
+            # Encoding to memory first keeps imwrite's stdio buffering out of
+            # the write, which goes to the file in one os.write call
+            success, encoded = cv2.imencode(os.path.splitext(output_path)[1], frame, self.encode_params)
+            if not success:
+                return False
             
-            # Save frame
-            success = cv2.imwrite(output_path, frame)
-            return success
+            data = memoryview(encoded).cast('B')
+            fd = os.open(output_path, self._write_flags, 0o644)
+            try:
+                while data:
+                    data = data[os.write(fd, data):]
+            finally:
+                os.close(fd)
+            return True
         except Exception as e:
             print(f"Error saving frame: {e}")
-            return False 
\ No newline at end of file
+            return False